@@ -8,7 +8,10 @@ import codecs # for utf8
 import string
 import copy
 import math
-from latexTable import MakeLatexTable
+import argparse
+from array import array
+from iterated_parsings import IteratedParsings, is_binary_parsings
+from wordbreaker import chunk_number, chunk_spans
 
 verboseflag = False
 
@@ -76,25 +79,27 @@ def chunks2breakpoints(chunk_list):
 		breakpoint_list.append(point)
 	return breakpoint_list
 
-def read_glossary (infile, glossary):
-    locations = list()
+# The glossary has two lines for each word: the word and its count, then "line:position" for each occurrence.
+# Returns a dict from each target word to its list of (line number, position). The targets are the
+# words in target_words, and also every word with a count of at least min_frequency, if that is more than 0.
+def read_glossary (infile, target_words, min_frequency = 0):
+    locations = dict()
     while (True):
         line = infile.readline()
         if not line:
             break
-        if line.startswith( target_word ):
-            lines_and_positions = infile.readline()
-            lines_and_positions = lines_and_positions.split(" ")
-            while (lines_and_positions):
-                line_and_position = lines_and_positions.pop(0)
-                pieces = line_and_position.split(":")
-                if len(pieces) < 2:
-                    break;
-                line, position = line_and_position.split(":")
-                line = line.strip()
-                position = position.strip()			
-                locations.append((line,position))
-            return locations
+        lines_and_positions = infile.readline()
+        word_and_count = line.split()
+        if len(word_and_count) < 2:
+            continue
+        word, count = word_and_count[0], int(word_and_count[1])
+        if word not in target_words and (min_frequency <= 0 or count < min_frequency):
+            continue
+        locations[word] = list()
+        for line_and_position in lines_and_positions.split():
+            line, position = line_and_position.split(":")
+            locations[word].append((int(line), int(position)))
+    return locations
 def detect_number_of_iterations(parsings_file):
 	count = 0
 	parsings_file.seek(0) # reset to beginning of file
@@ -112,13 +117,7 @@ def detect_number_of_iterations(parsings_file):
 # ---------------------------------------------------------#
 # Given a position in a string, return the piece number of the breakpoint list that it is in
 def position2chunk_number (breakpoint_list, position):
-		position = int(position)
-		for n in  range(len(breakpoint_list)):
-			if breakpoint_list[n] == position:
-				return n;
-			if breakpoint_list[n] > position:
-				return n-1
-		return -1	
+		return chunk_number(breakpoint_list, int(position))
 # ---------------------------------------------------------#
 # takes breakpoint list and two breakpoint indexes, and gives a string of letters
 def corpus_slice_sequence(corpus_line, breakpoint_list, first_piece_number, last_piece_number):
@@ -142,9 +141,7 @@ def piece_number2slice(corpus_line, breakpoints, chunk_number):
 # which shows how that True Parse (i.e., the target word) is analyzed in the parse
 # provided by "breakpoints".
 def find_parse_of_target_word(corpus_line, computed_breakpoints, target_word, start_point):
-		start_chunk_number = position2chunk_number(computed_breakpoints, start_point)
-		endpoint = int(start_point) + len(target_word) - 1
-		end_chunk_number = position2chunk_number( computed_breakpoints, endpoint)
+		[(start_chunk_number, end_chunk_number)] = chunk_spans(computed_breakpoints, [(int(start_point), len(target_word))])
 		return corpus_slice_sequence(corpus_line, computed_breakpoints, start_chunk_number, end_chunk_number)
 # ---------------------------------------------------------#
 def get_true_breakpoints(corpus_file, line_number):
@@ -170,20 +167,34 @@ def skip_to_next_iteration (infile,  ):
 			return  
 	return -1			
 # ---------------------------------------------------------# 
-def get_corpus_line(corpus_file, line_number):
-	#corpus_file.seek(0)
-	line_number = str(line_number)
-	while (True):
-		line=corpus_file.readline()
-		if not line:
-			return
-		if line== "#@#":
-			return ""
-		pieces = line.split(":",1)
-		if pieces[0] == line_number :
-			line =  pieces[1].strip()
-			true_break_points = corpus_file.readline();
-			return line, true_break_points
+# The processed corpus has two lines for each corpus line: "n:letters", then its true breakpoints.
+# The index is the byte offset of each "n:" line, so we can seek straight to line n. It is kept next
+# to the corpus file, and made again if the corpus file is newer.
+def read_corpus_index(corpus_filename):
+	index_filename = os.path.splitext(corpus_filename)[0] + "_index.bin"
+	corpus_index = array('Q')
+	if os.path.isfile(index_filename) and os.path.getmtime(index_filename) >= os.path.getmtime(corpus_filename):
+		with open(index_filename, "rb") as index_file:
+			corpus_index.frombytes(index_file.read())
+		return corpus_index
+	offset = 0
+	with open(corpus_filename, "rb") as corpus_file:
+		for n, line in enumerate(corpus_file):
+			if n % 2 == 0:
+				corpus_index.append(offset)
+			offset += len(line)
+	with open(index_filename, "wb") as index_file:
+		corpus_index.tofile(index_file)
+	return corpus_index
+# ---------------------------------------------------------# 
+# corpus_file is opened in binary mode, since the index is in bytes.
+def get_corpus_line(corpus_file, corpus_index, line_number, encoding = "utf-8"):
+	corpus_file.seek(corpus_index[int(line_number)])
+	line = corpus_file.readline().decode(encoding)
+	pieces = line.split(":",1)
+	line =  pieces[1].strip()
+	true_break_points = corpus_file.readline().decode(encoding)
+	return line, true_break_points
 # ---------------------------------------------------------# 
 def list_of_strings2ints(this_list):
 	result = list()
@@ -209,69 +220,134 @@ def get_breakpoints(infile_parsings, line_number, previous_computed_breakpoints)
 
 # ---------------------------------------------------------# 
 
-def analyze_history(corpus_file, infile_parsings, locations, target_word, profiles, number_of_iterations):
-	infile_parsings.readline()
-	current_line_number_in_parsings_file = 0
-	for iteration_number in range(number_of_iterations):
-		print ("iteration number ", iteration_number)
-		corpus_file.seek(0)
-		profile = Profile()
-		profiles.add_profile(iteration_number, profile) 
-		computed_breakpoints = list()
-		previous_line_number = -1
-		for n in range(len(locations)):
-			line_number, start_point = locations[n] 	
-			if not line_number == previous_line_number:
-				corpus_line, true_breakpoints = get_corpus_line(corpus_file, line_number)	 # fine
-				computed_breakpoints = get_breakpoints(infile_parsings, line_number, computed_breakpoints)
-			parse = find_parse_of_target_word(corpus_line, computed_breakpoints, target_word, start_point)
-			profile.add_parse(parse)
-			previous_line_number = line_number
-		skip_to_next_iteration (infile_parsings)
+def start_iteration_profiles(profiles, iteration_number):
+	print ("iteration number ", iteration_number)
+	this_iterations_profiles = dict()
+	for word in profiles:
+		this_iterations_profiles[word] = Profile()
+		profiles[word].add_profile(iteration_number, this_iterations_profiles[word])
+	return this_iterations_profiles
 
+def add_target_parses(this_iterations_profiles, targets, corpus_lines, line_number, computed_breakpoints):
+	corpus_line, true_breakpoints = corpus_lines[line_number]
+	spans = chunk_spans(computed_breakpoints, [(start_point, len(word)) for word, start_point in targets[line_number]])
+	for (word, start_point), (start_chunk_number, end_chunk_number) in zip(targets[line_number], spans):
+		parse = corpus_slice_sequence(corpus_line, computed_breakpoints, start_chunk_number, end_chunk_number)
+		this_iterations_profiles[word].add_parse(parse)
 
+# One pass over the parsings file fills in the profiles of all the target words together.
+# locations and profiles are dicts whose keys are the target words. infile_parsings is a text file,
+# or an IteratedParsings, from which we read just the target lines.
+def analyze_history(corpus_file, corpus_index, infile_parsings, locations, profiles):
+	# for each line that has a target word in it, the (word, start point) of each one
+	targets = dict()
+	for word, word_locations in locations.items():
+		for line_number, start_point in word_locations:
+			if line_number not in targets:
+				targets[line_number] = list()
+			targets[line_number].append((word, start_point))
+	# the corpus lines are the same on every iteration, so we read them once
+	corpus_lines = dict()
+	for line_number in sorted(targets):
+		corpus_lines[line_number] = get_corpus_line(corpus_file, corpus_index, line_number)
+	if isinstance(infile_parsings, IteratedParsings):
+		for iteration_number, iteration in enumerate(infile_parsings.Iterations()):
+			this_iterations_profiles = start_iteration_profiles(profiles, iteration_number)
+			for line_number in sorted(targets):
+				computed_breakpoints = infile_parsings.BreakPoints(iteration, line_number)
+				add_target_parses(this_iterations_profiles, targets, corpus_lines, line_number, computed_breakpoints)
+		return
+	infile_parsings.seek(0)
+	iteration_number = -1
+	for line in infile_parsings:
+		if line[:19] == "#current_iteration#":
+			iteration_number += 1
+			this_iterations_profiles = start_iteration_profiles(profiles, iteration_number)
+			continue
+		current_line = line.split(':')
+		if len(current_line) < 2 or int(current_line[0]) not in targets:
+			continue
+		line_number = int(current_line[0])
+		computed_breakpoints = list_of_strings2ints(current_line[1].split())
+		add_target_parses(this_iterations_profiles, targets, corpus_lines, line_number, computed_breakpoints)
 
 
 
 
 
 
-target_word = "history"
 
-directory 			= "../../data/english-browncorpus/wordbreaking/"
-outdirectory        = directory
-prefix              = "wordbreaker_brown_corpus_"
-num_iters 			= "50"
-new_words_per_iter  = "100"
-corpus_filename     = directory + prefix + num_iters + "_iters_" + new_words_per_iter + "_new_per_iteration"  + "_processed_corpus.txt"
-parsings_filename 	= directory + prefix + num_iters + "_iters_" + new_words_per_iter + "_new_per_iteration"  + "_iterated_parsings" + ".txt" 
-outfilename         = directory + prefix + num_iters + "_iters_" + new_words_per_iter + "_new_per_iteration"  +  "_analysis_" + target_word + ".txt"
-glossary_filename   = directory + prefix + num_iters + "_iters_" + new_words_per_iter + "_new_per_iteration"  + "_glossary" + ".txt"
 
-g_encoding = "utf8"
-if g_encoding == "utf8":
-	print ("utf8")
-	corpus_file = codecs.open(corpus_filename, "r", encoding = 'utf-8')
-	parsings_file = codecs.open(parsings_filename, "r", encoding = 'utf-8')
-	outfile = codecs.open(outfilename, "w", encoding = 'utf-8')
-	glossary_file = open (glossary_filename, "r", encoding = 'utf-8')
- 
-else:
-	print (1002)
-	corpus_file = codecs.open(corpus_filename, "r")
-	parsings_file = codecs.open(parsings_filename, "r")
-	outfile = codecs.open(outfilename, "w")
-	glossary_file = codecs.open(glossary_filename, "r")
- 
-profiles = Profiles(target_word)
-number_of_iterations = detect_number_of_iterations(parsings_file)
-locations = list()
-locations = read_glossary(glossary_file, locations)
-print (960, parsings_file.readline())
-analyze_history(corpus_file, parsings_file, locations, target_word,profiles, number_of_iterations) 
+def main(argv = None):
+	argument_parser = argparse.ArgumentParser(description = "Follow how wordbreaker parsed some words, iteration by iteration.")
+	argument_parser.add_argument("target_words", nargs = "*", default = ["history"], metavar = "word", help = "words to analyze (default: history)")
+	argument_parser.add_argument("--min-frequency", type = int, default = 0, metavar = "N", help = "also analyze every word that occurs at least N times (0: none)")
+	argument_parser.add_argument("--directory", default = "../../data/english-browncorpus/wordbreaking/", help = "directory wordbreaker wrote its output in")
+	argument_parser.add_argument("--prefix", default = "wordbreaker_brown_corpus_")
+	argument_parser.add_argument("--iterations", default = "50", help = "number of iterations wordbreaker ran")
+	argument_parser.add_argument("--candidates", default = "100", help = "new candidates on each of wordbreaker's iterations")
+	arguments = argument_parser.parse_args(argv)
+
+	# Analyze the words in target_words; or, if min_frequency is more than 0, every word that occurs
+	# at least that many times as well.
+	target_words = arguments.target_words
+	min_frequency = arguments.min_frequency
+	if min_frequency > 0:
+		target_name = "frequency_" + str(min_frequency)
+	else:
+		target_name = "_".join(target_words)
 
-print (profiles.display(), file = outfile )
+	directory 			= arguments.directory
+	outdirectory        = directory
+	prefix              = arguments.prefix
+	num_iters 			= arguments.iterations
+	new_words_per_iter  = arguments.candidates
+	corpus_filename     = directory + prefix + num_iters + "_iters_" + new_words_per_iter + "_new_per_iteration"  + "_processed_corpus.txt"
+	parsings_filename 	= directory + prefix + num_iters + "_iters_" + new_words_per_iter + "_new_per_iteration"  + "_iterated_parsings" + ".txt" 
+	# wordbreaker writes the parsings in binary instead with --parsings-format binary
+	if not os.path.isfile(parsings_filename):
+		parsings_filename = os.path.splitext(parsings_filename)[0] + ".bin"
+	outfilename         = directory + prefix + num_iters + "_iters_" + new_words_per_iter + "_new_per_iteration"  +  "_analysis_" + target_name + ".txt"
+	glossary_filename   = directory + prefix + num_iters + "_iters_" + new_words_per_iter + "_new_per_iteration"  + "_glossary" + ".txt"
 
+	g_encoding = "utf8"
+	if g_encoding == "utf8":
+		print ("utf8")
+		corpus_file = open(corpus_filename, "rb")
+		if is_binary_parsings(parsings_filename):
+			parsings_file = IteratedParsings(parsings_filename)
+		else:
+			parsings_file = codecs.open(parsings_filename, "r", encoding = 'utf-8')
+		outfile = codecs.open(outfilename, "w", encoding = 'utf-8')
+		glossary_file = open (glossary_filename, "r", encoding = 'utf-8')
  
+	else:
+		print (1002)
+		corpus_file = open(corpus_filename, "rb")
+		if is_binary_parsings(parsings_filename):
+			parsings_file = IteratedParsings(parsings_filename)
+		else:
+			parsings_file = codecs.open(parsings_filename, "r")
+		outfile = codecs.open(outfilename, "w")
+		glossary_file = codecs.open(glossary_filename, "r")
  
+	corpus_index = read_corpus_index(corpus_filename)
+	locations = read_glossary(glossary_file, target_words, min_frequency)
+	for target_word in target_words:
+		if target_word not in locations:
+			print ("Target word not found in glossary:", target_word)
+	profiles = dict()
+	for target_word in locations:
+		profiles[target_word] = Profiles(target_word)
+	if not isinstance(parsings_file, IteratedParsings):
+		print (960, parsings_file.readline())
+	analyze_history(corpus_file, corpus_index, parsings_file, locations, profiles) 
+
+	for target_word in sorted(profiles):
+		if len(profiles) > 1:
+			print ("#", target_word, file = outfile)
+		print (profiles[target_word].display(), file = outfile )
+
 
+if __name__ == "__main__":
+	main()
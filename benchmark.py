@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+
+from wordbreaker import Lexicon
+from iterated_parsings import TextParsingsWriter
+import analyze_wordbreaker
+
+# ---------------------------------------------------------#
+# Times each stage of the wordbreaker pipeline on a made-up corpus, and writes the results to
+# a JSON file, so that runs on different commits can be compared:
+#	python benchmark.py --lines 20000 --output before.json
+# The corpus is words over an alphabet of made-up letters, with Zipfian frequencies and
+# lengths drawn around a mean; the same seed always gives the same corpus.
+# ---------------------------------------------------------#
+
+def make_vocabulary(random_generator, alphabet, size, mean_word_length):
+	vocabulary = set()
+	while len(vocabulary) < size:
+		length = max(1, int(random_generator.expovariate(1.0 / mean_word_length) + 0.5))
+		vocabulary.add("".join(random_generator.choice(alphabet) for n in range(length)))
+	return sorted(vocabulary)
+
+def make_corpus(filename, lines, alphabet_size, vocabulary_size, mean_word_length, words_per_line, seed):
+	random_generator = random.Random(seed)
+	alphabet = [chr(ord('a') + n) if n < 26 else chr(0x3b1 + n - 26) for n in range(alphabet_size)]
+	vocabulary = make_vocabulary(random_generator, alphabet, vocabulary_size, mean_word_length)
+	random_generator.shuffle(vocabulary)
+	weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+	number_of_characters = 0
+	with open(filename, "w", encoding = 'utf-8') as outfile:
+		for line_number in range(lines):
+			length = max(2, int(random_generator.gauss(words_per_line, words_per_line / 3.0)))
+			words = random_generator.choices(vocabulary, weights, k = length)
+			number_of_characters += sum(len(word) for word in words)
+			print (" ".join(words), file = outfile)
+	return number_of_characters
+
+# ---------------------------------------------------------#
+# Adds the wall time (and, if memory is being traced, the peak of allocated memory) of
+# what runs inside it to results[stage].
+class Stage:
+	def __init__(self, results, stage, characters, trace_memory):
+		self.m_Results = results
+		self.m_Stage = stage
+		self.m_Characters = characters
+		self.m_TraceMemory = trace_memory
+	def __enter__(self):
+		if self.m_TraceMemory:
+			tracemalloc.reset_peak()
+		self.m_Start = time.perf_counter()
+	def __exit__(self, exception_type, exception, traceback):
+		seconds = time.perf_counter() - self.m_Start
+		if self.m_Stage not in self.m_Results:
+			self.m_Results[self.m_Stage] = {"calls": 0, "seconds": 0.0, "characters": 0, "peak_bytes": None}
+		result = self.m_Results[self.m_Stage]
+		result["calls"] += 1
+		result["seconds"] += seconds
+		result["characters"] += self.m_Characters
+		if self.m_TraceMemory:
+			result["peak_bytes"] = max(result["peak_bytes"] or 0, tracemalloc.get_traced_memory()[1])
+		return False
+
+def git_commit():
+	try:
+		return subprocess.run(["git", "rev-parse", "HEAD"], cwd = os.path.dirname(os.path.abspath(__file__)),
+			capture_output = True, text = True, check = True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+# ---------------------------------------------------------#
+def run_benchmark(arguments, directory):
+	corpus_filename = os.path.join(directory, "corpus.txt")
+	processed_corpus_filename = os.path.join(directory, "processed_corpus.txt")
+	glossary_filename = os.path.join(directory, "glossary.txt")
+	parsings_filename = os.path.join(directory, "iterated_parsings.txt")
+	characters = make_corpus(corpus_filename, arguments.lines, arguments.alphabet, arguments.vocabulary,
+		arguments.mean_word_length, arguments.words_per_line, arguments.seed)
+	results = dict()
+	def stage(name, stage_characters = characters):
+		return Stage(results, name, stage_characters, arguments.memory)
+
+	if arguments.memory:
+		tracemalloc.start()
+	lexicon = Lexicon()
+	lexicon.g_encoding = "utf8"
+	lexicon.m_CompactCorpus = arguments.compact
+	lexicon.m_NumberOfWorkers = arguments.workers
+	lexicon.m_IncrementalParsing = arguments.incremental
+	lexicon.m_ParseCacheSize = arguments.parse_cache_size
+	with open(os.devnull, "w") as null_file, open(parsings_filename, "w", encoding = 'utf-8') as parsings_file:
+		with contextlib.redirect_stdout(null_file):
+			with stage("ReadBrokenCorpus"):
+				lexicon.ReadBrokenCorpus(corpus_filename)
+			with open(processed_corpus_filename, "w", encoding = 'utf-8') as outfile, \
+				open(glossary_filename, "w", encoding = 'utf-8') as outfile_glossary:
+				lexicon.PrintBrokenCorpus(outfile, outfile_glossary)
+			parsings_writer = TextParsingsWriter(parsings_file)
+			with stage("ParseCorpus"):
+				lexicon.ParseCorpus(null_file, parsings_writer, 0)
+			for current_iteration in range(1, arguments.iterations):
+				with stage("GenerateCandidates"):
+					lexicon.GenerateCandidates(arguments.candidates, null_file)
+				with stage("ParseCorpus"):
+					lexicon.ParseCorpus(null_file, parsings_writer, current_iteration)
+				with stage("RecallPrecision"):
+					lexicon.RecallPrecision(current_iteration, null_file, 0)
+			sample = range(0, len(lexicon.m_Corpus), max(1, len(lexicon.m_Corpus) // arguments.sample_lines))
+			sample_characters = sum(len(lexicon.m_Corpus[line_number]) for line_number in sample)
+			with stage("ParseWord", sample_characters):
+				for line_number in sample:
+					lexicon.ParseWord(lexicon.m_Corpus[line_number], None)
+
+	# the history pass of analyze_wordbreaker, for the most frequent words
+	target_words = sorted(lexicon.m_TrueDictionary, key = lambda word: (-lexicon.m_TrueDictionary[word], word))[:arguments.targets]
+	with open(os.devnull, "w") as null_file, contextlib.redirect_stdout(null_file):
+		with stage("analyze_history", characters * arguments.iterations):
+			corpus_index = analyze_wordbreaker.read_corpus_index(processed_corpus_filename)
+			with open(glossary_filename, encoding = 'utf-8') as glossary_file:
+				locations = analyze_wordbreaker.read_glossary(glossary_file, target_words)
+			profiles = dict()
+			for word in locations:
+				profiles[word] = analyze_wordbreaker.Profiles(word)
+			with open(processed_corpus_filename, "rb") as corpus_file, open(parsings_filename, encoding = 'utf-8') as parsings_file:
+				analyze_wordbreaker.analyze_history(corpus_file, corpus_index, parsings_file, locations, profiles)
+	if arguments.memory:
+		tracemalloc.stop()
+
+	for result in results.values():
+		result["characters_per_second"] = result["characters"] / result["seconds"] if result["seconds"] > 0 else None
+	return {
+		"commit": git_commit(),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"time": time.strftime("%Y-%m-%d %H:%M:%S"),
+		"settings": vars(arguments),
+		"corpus": {"lines": len(lexicon.m_Corpus), "characters": characters, "distinct_words": len(lexicon.m_TrueDictionary)},
+		"lexicon_size": len(lexicon.m_EntryDict),
+		"stages": results,
+	}
+
+def print_results(benchmark, outfile):
+	print ("%-20s %6s %10s %16s %14s" % ("stage", "calls", "seconds", "characters/sec", "peak MB"), file = outfile)
+	for stage, result in benchmark["stages"].items():
+		peak = "-" if result["peak_bytes"] is None else "%.1f" % (result["peak_bytes"] / 1e6)
+		print ("%-20s %6i %10.3f %16s %14s" % (stage, result["calls"], result["seconds"],
+			"{:,.0f}".format(result["characters_per_second"] or 0), peak), file = outfile)
+
+def main(argv = None):
+	argument_parser = argparse.ArgumentParser(description = "Time the stages of wordbreaker on a made-up corpus.")
+	argument_parser.add_argument("--lines", type = int, default = 5000)
+	argument_parser.add_argument("--alphabet", type = int, default = 26, help = "number of letters")
+	argument_parser.add_argument("--vocabulary", type = int, default = 5000, help = "number of distinct words")
+	argument_parser.add_argument("--mean-word-length", type = float, default = 4.5)
+	argument_parser.add_argument("--words-per-line", type = float, default = 12)
+	argument_parser.add_argument("--seed", type = int, default = 1)
+	argument_parser.add_argument("--iterations", type = int, default = 5)
+	argument_parser.add_argument("--candidates", type = int, default = 100, help = "candidates on each iteration")
+	argument_parser.add_argument("--sample-lines", type = int, default = 1000, help = "lines to time ParseWord on")
+	argument_parser.add_argument("--targets", type = int, default = 20, help = "words to run the history analysis for")
+	argument_parser.add_argument("--compact", action = "store_true")
+	argument_parser.add_argument("--incremental", action = "store_true")
+	argument_parser.add_argument("--workers", type = int, default = 1)
+	argument_parser.add_argument("--parse-cache-size", type = int, default = 100000)
+	argument_parser.add_argument("--memory", action = "store_true", help = "also measure peak memory with tracemalloc (slows everything down)")
+	argument_parser.add_argument("--output", default = "benchmark.json", help = "JSON file for the results")
+	arguments = argument_parser.parse_args(argv)
+	with tempfile.TemporaryDirectory() as directory:
+		benchmark = run_benchmark(arguments, directory)
+	with open(arguments.output, "w", encoding = 'utf-8') as outfile:
+		json.dump(benchmark, outfile, indent = 1)
+	print_results(benchmark, sys.stdout)
+	print ("Results written to", arguments.output)
+
+if __name__ == "__main__":
+	main()
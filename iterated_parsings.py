@@ -0,0 +1,290 @@
+import sys
+import os
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+
+# ---------------------------------------------------------#
+# The iterated parsings: for each iteration, the breakpoints of the parse of each line.
+# wordbreaker writes them through one of the writers here, and analyze_wordbreaker reads them.
+#
+# The text format is "#current_iteration#  n" at the start of each iteration, then a line
+# "line_number:bp bp bp ..." for each corpus line.
+#
+# The binary format is
+#	header:	magic (8 bytes), offset of the index (uint64)
+#	blocks:	one per iteration. A block is a record for each line it stores: the number of
+#		breakpoints, then each breakpoint minus the one before it, all as varints.
+#	index:	number of iterations (uint32); then for each iteration its number (int32), the offset
+#		of its block (uint64), its flags (uint32) and the number of lines it stores (uint32),
+#		followed by two uint32 arrays: the numbers of those lines (increasing), and the offset
+#		of each one's record from the start of the block.
+# Everything is little-endian. The reader maps the file, and goes straight to (iteration, line).
+#
+# Normally every iteration stores every line. In a delta history, only snapshot iterations do:
+# the first one, and every snapshot_interval-th after it (if that is more than 0). The others
+# store just the lines whose breakpoints changed, and the reader looks back for the rest.
+# ---------------------------------------------------------#
+
+BinaryParsingsMagic = b"WBPARSE1"
+HeaderFormat = "<8sQ"
+IterationFormat = "<iQII"
+AllLinesFlag = 1  # the iteration stores every line
+
+def encode_varints(numbers, outbytes):
+	for number in numbers:
+		while number >= 0x80:
+			outbytes.append((number & 0x7f) | 0x80)
+			number >>= 7
+		outbytes.append(number)
+
+def decode_varint(inbytes, position):
+	number = 0
+	shift = 0
+	while True:
+		byte = inbytes[position]
+		position += 1
+		number |= (byte & 0x7f) << shift
+		if byte < 0x80:
+			return number, position
+		shift += 7
+
+def little_endian(this_array):
+	if sys.byteorder != "little":
+		this_array = array(this_array.typecode, this_array)
+		this_array.byteswap()
+	return this_array
+
+# ---------------------------------------------------------#
+def is_binary_parsings(filename):
+	with open(filename, "rb") as infile:
+		return infile.read(len(BinaryParsingsMagic)) == BinaryParsingsMagic
+
+# ---------------------------------------------------------#
+class TextParsingsWriter:
+	def __init__(self, outfile):
+		self.m_Outfile = outfile
+	def StartIteration(self, iteration):
+		print  ("#current_iteration# ", iteration, file = self.m_Outfile )
+	def WriteLine(self, line_number, breakpoint_list):
+		print (line_number, ':', sep='', file = self.m_Outfile, end = '')
+		print (*breakpoint_list, sep=' ', file = self.m_Outfile)
+	# what a checkpoint needs to know to go on writing this file later
+	def Checkpoint(self):
+		self.m_Outfile.flush()
+		return {"size": os.fstat(self.m_Outfile.fileno()).st_size}
+	def WritesEveryLine(self):
+		return True
+	def close(self):
+		self.m_Outfile.close()
+
+# ---------------------------------------------------------#
+# snapshot_interval None writes every line of every iteration; otherwise this writes a delta history.
+# Given what Checkpoint returned, this goes on writing the file from that point.
+class BinaryParsingsWriter:
+	def __init__(self, filename, snapshot_interval = None, checkpoint = None):
+		self.m_Iterations = list()  # (iteration, block offset, flags, line numbers, record offsets)
+		self.m_Block = bytearray()
+		self.m_SnapshotInterval = snapshot_interval
+		self.m_LastRecords = list()  # in a delta history, the last record written for each line
+		if checkpoint is None:
+			self.m_Outfile = open(filename, "wb")
+			self.m_Outfile.write(struct.pack(HeaderFormat, BinaryParsingsMagic, 0))
+			return
+		self.m_Outfile = open(filename, "r+b")
+		self.m_Outfile.truncate(checkpoint["size"])
+		self.m_Outfile.seek(checkpoint["size"])
+		for iteration, block_offset, flags, line_numbers, record_offsets in checkpoint["iterations"]:
+			self.m_Iterations.append((iteration, block_offset, flags, array('I', line_numbers), array('I', record_offsets)))
+		for record in checkpoint["last_records"]:
+			if record is not None:
+				record = bytearray.fromhex(record)
+			self.m_LastRecords.append(record)
+	def StartIteration(self, iteration):
+		self.FinishBlock()
+		flags = 0
+		if self.m_SnapshotInterval is None or len(self.m_Iterations) == 0 or \
+			(self.m_SnapshotInterval > 0 and len(self.m_Iterations) % self.m_SnapshotInterval == 0):
+			flags = AllLinesFlag
+		self.m_Iterations.append((iteration, self.m_Outfile.tell(), flags, array('I'), array('I')))
+	# False in the iterations of a delta history that only store the lines that changed: then
+	# it is enough to be given those, in order.
+	def WritesEveryLine(self):
+		return bool(self.m_Iterations[-1][2] & AllLinesFlag)
+	def WriteLine(self, line_number, breakpoint_list):
+		iteration, block_offset, flags, line_numbers, record_offsets = self.m_Iterations[-1]
+		record = bytearray()
+		encode_varints([len(breakpoint_list)], record)
+		previous = 0
+		deltas = list()
+		for breakpoint in breakpoint_list:
+			deltas.append(breakpoint - previous)
+			previous = breakpoint
+		encode_varints(deltas, record)
+		if self.m_SnapshotInterval is not None:
+			while len(self.m_LastRecords) <= line_number:
+				self.m_LastRecords.append(None)
+			if not flags & AllLinesFlag and self.m_LastRecords[line_number] == record:
+				return
+			self.m_LastRecords[line_number] = record
+		line_numbers.append(line_number)
+		record_offsets.append(len(self.m_Block))
+		self.m_Block += record
+	def FinishBlock(self):
+		self.m_Outfile.write(self.m_Block)
+		self.m_Block = bytearray()
+	def Checkpoint(self):
+		self.FinishBlock()
+		self.m_Outfile.flush()
+		checkpoint = dict()
+		checkpoint["size"] = self.m_Outfile.tell()
+		checkpoint["iterations"] = [(iteration, block_offset, flags, list(line_numbers), list(record_offsets))
+			for iteration, block_offset, flags, line_numbers, record_offsets in self.m_Iterations]
+		checkpoint["last_records"] = [record and record.hex() for record in self.m_LastRecords]
+		return checkpoint
+	def close(self):
+		self.FinishBlock()
+		if self.m_Outfile.tell() % 4 != 0:
+			self.m_Outfile.write(bytes(4 - self.m_Outfile.tell() % 4))
+		index_offset = self.m_Outfile.tell()
+		self.m_Outfile.write(struct.pack("<I", len(self.m_Iterations)))
+		for iteration, block_offset, flags, line_numbers, record_offsets in self.m_Iterations:
+			self.m_Outfile.write(struct.pack(IterationFormat, iteration, block_offset, flags, len(line_numbers)))
+			little_endian(line_numbers).tofile(self.m_Outfile)
+			little_endian(record_offsets).tofile(self.m_Outfile)
+		self.m_Outfile.seek(0)
+		self.m_Outfile.write(struct.pack(HeaderFormat, BinaryParsingsMagic, index_offset))
+		self.m_Outfile.close()
+
+# ---------------------------------------------------------#
+# Reads the binary format. The line tables are views into the mapped file, not copies
+# (except on a big-endian machine).
+class IteratedParsings:
+	def __init__(self, filename):
+		self.m_File = open(filename, "rb")
+		self.m_Map = mmap.mmap(self.m_File.fileno(), 0, access = mmap.ACCESS_READ)
+		if len(self.m_Map) < struct.calcsize(HeaderFormat):
+			self.Reject(filename + " is too short to be a binary parsings file.")
+		magic, index_offset = struct.unpack_from(HeaderFormat, self.m_Map, 0)
+		if magic != BinaryParsingsMagic:
+			self.Reject(filename + " is not a binary parsings file.")
+		# the writer only fills in the index offset when it is closed
+		if index_offset == 0 or index_offset + 4 > len(self.m_Map):
+			self.Reject(filename + " has no index: the run that wrote it did not finish (its index offset is " + str(index_offset) + ").")
+		self.m_Iterations = list()  # (iteration, block offset, flags, line numbers, record offsets)
+		self.m_IterationIndex = dict()  # iteration number to its place in m_Iterations
+		(number_of_iterations,) = struct.unpack_from("<I", self.m_Map, index_offset)
+		# check that the whole index is in the file, before there are any views into the map
+		position = index_offset + 4
+		for n in range(number_of_iterations):
+			if position + struct.calcsize(IterationFormat) > len(self.m_Map):
+				self.Reject(filename + " has a truncated index.")
+			number_of_lines = struct.unpack_from(IterationFormat, self.m_Map, position)[3]
+			position += struct.calcsize(IterationFormat) + 8 * number_of_lines
+			if position > len(self.m_Map):
+				self.Reject(filename + " has a truncated index.")
+		view = memoryview(self.m_Map)
+		position = index_offset + 4
+		for n in range(number_of_iterations):
+			iteration, block_offset, flags, number_of_lines = struct.unpack_from(IterationFormat, self.m_Map, position)
+			position += struct.calcsize(IterationFormat)
+			line_numbers = view[position:position + 4 * number_of_lines].cast('I')
+			position += 4 * number_of_lines
+			record_offsets = view[position:position + 4 * number_of_lines].cast('I')
+			position += 4 * number_of_lines
+			if sys.byteorder != "little":
+				line_numbers = little_endian(array('I', line_numbers))
+				record_offsets = little_endian(array('I', record_offsets))
+			self.m_IterationIndex[iteration] = len(self.m_Iterations)
+			self.m_Iterations.append((iteration, block_offset, flags, line_numbers, record_offsets))
+	def close(self):
+		# the views into the map have to go before the map can be closed
+		self.m_Iterations = list()
+		self.m_Map.close()
+		self.m_File.close()
+	def Reject(self, message):
+		self.close()
+		raise ValueError(message)
+	def Iterations(self):
+		return [iteration[0] for iteration in self.m_Iterations]
+	def ReadRecord(self, position):
+		count, position = decode_varint(self.m_Map, position)
+		breakpoint_list = list()
+		breakpoint = 0
+		for n in range(count):
+			delta, position = decode_varint(self.m_Map, position)
+			breakpoint += delta
+			breakpoint_list.append(breakpoint)
+		return breakpoint_list
+	# Where the record of a line is in the iteration at place n of m_Iterations, or None if that
+	# iteration does not store the line.
+	def RecordPosition(self, n, line_number):
+		iteration, block_offset, flags, line_numbers, record_offsets = self.m_Iterations[n]
+		k = bisect_left(line_numbers, line_number)
+		if k == len(line_numbers) or line_numbers[k] != line_number:
+			return None
+		return block_offset + record_offsets[k]
+	# The breakpoints of a line in an iteration, looking back as far as the last snapshot if the
+	# line did not change in it. None if there is no such line.
+	def BreakPoints(self, iteration, line_number):
+		n = self.m_IterationIndex[iteration]
+		while n >= 0:
+			position = self.RecordPosition(n, line_number)
+			if position is not None:
+				return self.ReadRecord(position)
+			if self.m_Iterations[n][2] & AllLinesFlag:
+				return None
+			n -= 1
+		return None
+	# The lines whose breakpoints are different in this iteration from the one before: in a delta
+	# history, just the lines it stores, unless it is a snapshot. Every line, in the first iteration.
+	def ChangedLines(self, iteration):
+		n = self.m_IterationIndex[iteration]
+		line_numbers = self.m_Iterations[n][3]
+		if n == 0 or not self.m_Iterations[n][2] & AllLinesFlag:
+			return list(line_numbers)
+		previous_iteration = self.m_Iterations[n - 1][0]
+		changed_lines = list()
+		for line_number, breakpoint_list in self.IterationLines(iteration):
+			if breakpoint_list != self.BreakPoints(previous_iteration, line_number):
+				changed_lines.append(line_number)
+		return changed_lines
+	# (line number, breakpoints) for each line an iteration stores; see BreakPoints for the others
+	def IterationLines(self, iteration):
+		iteration, block_offset, flags, line_numbers, record_offsets = self.m_Iterations[self.m_IterationIndex[iteration]]
+		for n in range(len(line_numbers)):
+			yield line_numbers[n], self.ReadRecord(block_offset + record_offsets[n])
+
+# ---------------------------------------------------------#
+# Reads the text format, as (iteration, line number, breakpoints).
+def read_text_parsings(infile):
+	iteration = None
+	for line in infile:
+		if line[:19] == "#current_iteration#":
+			iteration = int(line[19:])
+			continue
+		pieces = line.split(':', 1)
+		if len(pieces) < 2:
+			continue
+		yield iteration, int(pieces[0]), [int(number) for number in pieces[1].split()]
+
+def convert_text_parsings(text_filename, binary_filename, snapshot_interval = None):
+	writer = BinaryParsingsWriter(binary_filename, snapshot_interval)
+	current_iteration = None
+	with open(text_filename, encoding = 'utf-8') as infile:
+		for iteration, line_number, breakpoint_list in read_text_parsings(infile):
+			if iteration != current_iteration:
+				writer.StartIteration(iteration)
+				current_iteration = iteration
+			writer.WriteLine(line_number, breakpoint_list)
+	writer.close()
+
+if __name__ == "__main__":
+	if len(sys.argv) not in (3, 4):
+		print ("usage: python iterated_parsings.py <iterated_parsings.txt> <iterated_parsings.bin> [snapshot interval]")
+		sys.exit(1)
+	snapshot_interval = None
+	if len(sys.argv) == 4:
+		snapshot_interval = int(sys.argv[3])
+	convert_text_parsings(sys.argv[1], sys.argv[2], snapshot_interval)
@@ -0,0 +1,165 @@
+import sys
+import mmap
+import math
+import struct
+from array import array
+from bisect import bisect_left
+
+from iterated_parsings import little_endian
+
+# ---------------------------------------------------------#
+# A trained lexicon in one file, for segmenter.py to load, written by wordbreaker at the end of a run.
+# The format is
+#	header:	magic (8 bytes); the number of entries, the length of the key blob in bytes, the number
+#		of trie nodes (0 if there is no trie) and the length of the longest key, in letters (all
+#		uint32); the cost of a letter that is not in the lexicon (float32); 4 bytes of padding.
+#	offsets:	uint32, one more than there are entries: key n is blob[offsets[n]:offsets[n+1]]
+#	costs:	float32, the cost of each entry, -log of its frequency
+#	trie:	three arrays over the nodes, the root first and then breadth first, so that the
+#		children of a node are always consecutive nodes: first_child (uint32, one more than
+#		there are nodes: the children of node n are nodes first_child[n] to first_child[n+1]-1),
+#		letter (uint32, the code point on the edge into the node, increasing among siblings)
+#		and entry (int32, the entry the path to the node spells, or -1).
+#	blob:	the keys, sorted, in UTF-8, run together
+# Everything is little-endian. An entry's ID is its place in sorted order.
+# The costs are rounded to float32, so where two parses of a text cost nearly the same, a segmenter
+# loaded from this file can choose the other one from what Lexicon.ParseWord, or a segmenter loaded
+# from a checkpoint, would.
+#
+# LexiconFile maps the file and reads straight out of the map, so loading it does not depend on
+# the size of the lexicon, and the processes that load the same file share its pages. Without a
+# trie, Matches looks up each prefix in the sorted keys instead.
+# ---------------------------------------------------------#
+
+LexiconFileMagic = b"WBLEXIC1"
+HeaderFormat = "<8sIIIIf4x"
+
+def is_lexicon_file(filename):
+	with open(filename, "rb") as infile:
+		return infile.read(len(LexiconFileMagic)) == LexiconFileMagic
+
+# The trie over keys, as the three arrays above.
+def build_trie_arrays(keys):
+	root = dict()
+	for id, key in enumerate(keys):
+		node = root
+		for letter in key:
+			node = node.setdefault(ord(letter), dict())
+		node[None] = id
+	first_child = array('I')
+	letters = array('I', [0])
+	entries = array('i', [root.get(None, -1)])
+	queue = [root]
+	n = 0
+	while n < len(queue):
+		node = queue[n]
+		n += 1
+		first_child.append(len(queue))
+		for letter in sorted(code for code in node if code is not None):
+			child = node[letter]
+			queue.append(child)
+			letters.append(letter)
+			entries.append(child.get(None, -1))
+	first_child.append(len(queue))
+	return first_child, letters, entries
+
+# costs: entry to its cost, like Lexicon.m_EntryPlog. Entries that cost infinity are left out.
+def write_lexicon_file(filename, costs, with_trie = True):
+	keys = sorted(key for key, cost in costs.items() if not math.isinf(cost))
+	blob = bytearray()
+	offsets = array('I', [0])
+	for key in keys:
+		blob += key.encode('utf-8')
+		offsets.append(len(blob))
+	entry_costs = array('f', [costs[key] for key in keys])
+	# as in Segmenter: a letter the lexicon has never seen costs as much as the costliest entry
+	unknown_cost = max(entry_costs, default = 0.0)
+	longest = max((len(key) for key in keys), default = 0)
+	if with_trie:
+		trie_arrays = build_trie_arrays(keys)
+	else:
+		trie_arrays = (array('I', [0]), array('I'), array('i'))
+	number_of_nodes = len(trie_arrays[1])
+	with open(filename, "wb") as outfile:
+		outfile.write(struct.pack(HeaderFormat, LexiconFileMagic, len(keys), len(blob), number_of_nodes, longest, unknown_cost))
+		for this_array in (offsets, entry_costs) + trie_arrays:
+			outfile.write(little_endian(this_array).tobytes())
+		outfile.write(blob)
+
+# ---------------------------------------------------------#
+class LexiconFile:
+	def __init__(self, filename):
+		self.m_File = open(filename, "rb")
+		self.m_Map = mmap.mmap(self.m_File.fileno(), 0, access = mmap.ACCESS_READ)
+		magic, number_of_entries, blob_length, number_of_nodes, longest, unknown_cost = struct.unpack_from(HeaderFormat, self.m_Map, 0)
+		if magic != LexiconFileMagic:
+			raise ValueError(filename + " is not a lexicon file.")
+		self.m_NumberOfEntries = number_of_entries
+		self.m_NumberOfNodes = number_of_nodes
+		self.m_SizeOfLongestEntry = longest
+		self.m_UnknownCost = unknown_cost
+		view = memoryview(self.m_Map)
+		position = struct.calcsize(HeaderFormat)
+		sections = list()
+		for typecode, length in (('I', number_of_entries + 1), ('f', number_of_entries), ('I', number_of_nodes + 1), ('I', number_of_nodes), ('i', number_of_nodes)):
+			section = view[position:position + 4 * length].cast(typecode)
+			if sys.byteorder != "little":
+				section = little_endian(array(typecode, section))
+			sections.append(section)
+			position += 4 * length
+		self.m_Offsets, self.m_Costs, self.m_FirstChild, self.m_Letters, self.m_Entries = sections
+		self.m_Blob = view[position:position + blob_length]
+	def close(self):
+		# the views into the map have to go before the map can be closed
+		self.m_Offsets = self.m_Costs = self.m_FirstChild = self.m_Letters = self.m_Entries = self.m_Blob = None
+		self.m_Map.close()
+		self.m_File.close()
+	def __len__(self):
+		return self.m_NumberOfEntries
+	# the key of entry n; so the file itself is the sorted sequence of keys, for bisect
+	def __getitem__(self, n):
+		if not 0 <= n < self.m_NumberOfEntries:
+			raise IndexError(n)
+		return str(self.m_Blob[self.m_Offsets[n]:self.m_Offsets[n + 1]], 'utf-8')
+	def Key(self, id):
+		return self[id]
+	# the ID of key, or -1
+	def Find(self, key):
+		n = bisect_left(self, key)
+		if n < self.m_NumberOfEntries and self[n] == key:
+			return n
+		return -1
+	# Yields (end position, entry ID) for every entry that starts at position start in word,
+	# the way LexiconTrie.Matches does.
+	def Matches(self, word, start):
+		if self.m_NumberOfNodes == 0:
+			yield from self.MatchesWithoutTrie(word, start)
+			return
+		first_child = self.m_FirstChild
+		letters = self.m_Letters
+		node = 0
+		for position in range(start, len(word)):
+			letter = ord(word[position])
+			low, high = first_child[node], first_child[node + 1]
+			node = bisect_left(letters, letter, low, high)
+			if node == high or letters[node] != letter:
+				return
+			if self.m_Entries[node] >= 0:
+				yield (position + 1, self.m_Entries[node])
+	def MatchesWithoutTrie(self, word, start):
+		low = 0
+		for end in range(start + 1, min(len(word), start + self.m_SizeOfLongestEntry) + 1):
+			prefix = word[start:end]
+			low = bisect_left(self, prefix, low)
+			if low == self.m_NumberOfEntries or not self[low].startswith(prefix):
+				return
+			if self[low] == prefix:
+				yield (end, low)
+
+if __name__ == "__main__":
+	if len(sys.argv) != 3:
+		print ("usage: python lexicon_file.py <checkpoint.json> <lexicon.bin>")
+		sys.exit(1)
+	from segmenter import checkpoint_costs
+	from wordbreaker import read_checkpoint
+	write_lexicon_file(sys.argv[2], checkpoint_costs(read_checkpoint(sys.argv[1])))
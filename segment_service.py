@@ -0,0 +1,348 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from segmenter import load_segmenter
+
+# ---------------------------------------------------------#
+# Serves a frozen segmenter (segmenter.py) over HTTP, on a local port or a Unix socket:
+#	python segment_service.py serve ..._lexicon.bin --port 8765 --workers 4
+#	python segment_service.py load --port 8765 --requests 10000 --concurrency 64 --texts corpus.txt
+#
+#	POST /segment	{"text": "thecatsat"}			-> {"words": ["the", "cat", "sat"]}
+#					{"texts": ["thecat", "sat"]}	-> {"words": [["the", "cat"], ["sat"]]}
+#	GET /stats		requests, batches, and p50/p99 latency over the last requests, in milliseconds
+#
+# The event loop only reads requests and writes replies. The texts go into a micro-batch, which
+# is sent to a pool of worker processes once it holds --batch-size texts or its first text has
+# waited --batch-wait milliseconds. The workers all map the same lexicon file, so they share it.
+# If a worker process dies, the pool is replaced and its batch is sent once more.
+# ---------------------------------------------------------#
+
+# the segmenter of this worker process; see start_worker
+g_segmenter = None
+def start_worker(filename):
+	global g_segmenter
+	g_segmenter = load_segmenter(filename)
+
+def segment_in_worker(texts):
+	return g_segmenter.segment_batch(texts)
+
+# nearest-rank percentile of a list that is already sorted
+def percentile(sorted_values, fraction):
+	if len(sorted_values) == 0:
+		return None
+	return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+# ---------------------------------------------------------#
+# Latencies of the last so many requests, and counts since the start.
+class LatencyRecorder:
+	def __init__(self, window = 10000):
+		self.m_Latencies = deque(maxlen = window)
+		self.m_Requests = 0
+		self.m_Texts = 0
+		self.m_Batches = 0
+		self.m_Errors = 0
+		self.m_PoolRestarts = 0
+		self.m_StartTime = time.time()
+	def Add(self, seconds, texts):
+		self.m_Latencies.append(seconds)
+		self.m_Requests += 1
+		self.m_Texts += texts
+	def Report(self):
+		latencies = sorted(self.m_Latencies)
+		milliseconds = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+		return {
+			"requests": self.m_Requests,
+			"texts": self.m_Texts,
+			"batches": self.m_Batches,
+			"errors": self.m_Errors,
+			"pool_restarts": self.m_PoolRestarts,
+			"texts_per_batch": self.m_Texts / self.m_Batches if self.m_Batches > 0 else None,
+			"uptime_seconds": round(time.time() - self.m_StartTime, 3),
+			"p50_ms": milliseconds(percentile(latencies, 0.50)),
+			"p99_ms": milliseconds(percentile(latencies, 0.99)),
+			"max_ms": milliseconds(latencies[-1] if latencies else None),
+		}
+
+# ---------------------------------------------------------#
+# Collects texts from concurrent requests into batches for the pool. make_pool makes the pool,
+# and makes a new one when a worker process dies: a pool that has lost a worker is broken for good.
+class MicroBatcher:
+	def __init__(self, make_pool, batch_size, batch_wait, recorder):
+		self.m_MakePool = make_pool
+		self.m_Pool = make_pool()
+		self.m_BatchSize = batch_size
+		self.m_BatchWait = batch_wait
+		self.m_Recorder = recorder
+		self.m_Texts = list()
+		self.m_Futures = list()
+		self.m_Timer = None
+	# the words of text, once its batch comes back
+	def segment(self, text):
+		loop = asyncio.get_running_loop()
+		future = loop.create_future()
+		self.m_Texts.append(text)
+		self.m_Futures.append(future)
+		if len(self.m_Texts) >= self.m_BatchSize:
+			self.Flush()
+		elif self.m_Timer is None:
+			self.m_Timer = loop.call_later(self.m_BatchWait, self.Flush)
+		return future
+	def Flush(self):
+		if self.m_Timer is not None:
+			self.m_Timer.cancel()
+			self.m_Timer = None
+		if len(self.m_Texts) == 0:
+			return
+		texts, futures = self.m_Texts, self.m_Futures
+		self.m_Texts = list()
+		self.m_Futures = list()
+		self.m_Recorder.m_Batches += 1
+		self.Submit(texts, futures, True)
+	def Submit(self, texts, futures, retry):
+		loop = asyncio.get_running_loop()
+		pool = self.m_Pool
+		try:
+			batch = loop.run_in_executor(pool, segment_in_worker, texts)
+		except BrokenProcessPool as error:
+			# it broke since its last batch came back
+			batch = loop.create_future()
+			batch.set_exception(error)
+		batch.add_done_callback(lambda batch: self.Deliver(batch, pool, texts, futures, retry))
+	def Deliver(self, batch, pool, texts, futures, retry):
+		if isinstance(batch.exception(), BrokenProcessPool):
+			self.ReplacePool(pool)
+			# the batch may not be what killed the worker, so it gets another try, but only one:
+			# a text that kills every worker it is sent to should not take the pool down forever
+			if retry:
+				self.Submit(texts, futures, False)
+				return
+		if batch.exception() is not None:
+			for future in futures:
+				if not future.done():
+					future.set_exception(batch.exception())
+			return
+		for future, words in zip(futures, batch.result()):
+			if not future.done():
+				future.set_result(words)
+	# Every batch that was out when pool broke fails with it; only the first one replaces it.
+	def ReplacePool(self, pool):
+		if pool is not self.m_Pool:
+			return
+		self.m_Pool = self.m_MakePool()
+		self.m_Recorder.m_PoolRestarts += 1
+		pool.shutdown(wait = False)
+	def close(self):
+		self.m_Pool.shutdown()
+
+# ---------------------------------------------------------#
+# Just enough HTTP/1.1 for this: a request line, headers, a body of Content-Length bytes,
+# and connections kept open until the client closes them.
+async def read_request(reader):
+	request_line = await reader.readline()
+	if not request_line:
+		return None
+	method, path, version = request_line.decode('latin-1').split()
+	headers = dict()
+	while True:
+		line = await reader.readline()
+		if line in (b"\r\n", b"\n", b""):
+			break
+		name, value = line.decode('latin-1').split(":", 1)
+		headers[name.strip().lower()] = value.strip()
+	body = await reader.readexactly(int(headers.get("content-length", 0)))
+	return (method, path, headers, body)
+
+def write_response(writer, status, reply):
+	body = json.dumps(reply, ensure_ascii = False).encode('utf-8')
+	writer.write(("HTTP/1.1 %s\r\nContent-Type: application/json; charset=utf-8\r\nContent-Length: %i\r\n\r\n"
+		% (status, len(body))).encode('latin-1') + body)
+
+# The texts of a request to /segment, and whether it was {"texts": [...]} rather than {"text": ...}.
+# A request that is neither is refused here, before any of it is put in a batch with the texts
+# of other requests.
+def request_texts(body):
+	request = json.loads(body.decode('utf-8'))
+	if not isinstance(request, dict):
+		raise ValueError("the request has to be a JSON object")
+	if "texts" in request:
+		texts = request["texts"]
+		if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+			raise ValueError('"texts" has to be a list of strings')
+		return (texts, True)
+	if not isinstance(request.get("text"), str):
+		raise ValueError('"text" has to be a string')
+	return ([request["text"]], False)
+
+class SegmentService:
+	def __init__(self, batcher, recorder):
+		self.m_Batcher = batcher
+		self.m_Recorder = recorder
+	async def HandleConnection(self, reader, writer):
+		try:
+			while True:
+				request = await read_request(reader)
+				if request is None:
+					break
+				status, reply = await self.HandleRequest(*request)
+				write_response(writer, status, reply)
+				await writer.drain()
+		except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+			pass
+		finally:
+			writer.close()
+	async def HandleRequest(self, method, path, headers, body):
+		if method == "GET" and path == "/stats":
+			return ("200 OK", self.m_Recorder.Report())
+		if method != "POST" or path != "/segment":
+			return ("404 Not Found", {"error": "POST /segment or GET /stats"})
+		start = time.perf_counter()
+		try:
+			texts, several = request_texts(body)
+		except ValueError as error:
+			self.m_Recorder.m_Errors += 1
+			return ("400 Bad Request", {"error": str(error)})
+		try:
+			words = await asyncio.gather(*[self.m_Batcher.segment(text) for text in texts])
+		except Exception as error:
+			self.m_Recorder.m_Errors += 1
+			return ("500 Internal Server Error", {"error": repr(error)})
+		self.m_Recorder.Add(time.perf_counter() - start, len(texts))
+		return ("200 OK", {"words": list(words) if several else words[0]})
+
+async def report_periodically(recorder, interval):
+	while True:
+		await asyncio.sleep(interval)
+		print (json.dumps(recorder.Report()), flush = True)
+
+async def serve(arguments):
+	recorder = LatencyRecorder(arguments.window)
+	context = multiprocessing.get_context("fork")
+	make_pool = lambda: ProcessPoolExecutor(arguments.workers, mp_context = context, initializer = start_worker, initargs = (arguments.lexicon,))
+	batcher = MicroBatcher(make_pool, arguments.batch_size, arguments.batch_wait / 1000.0, recorder)
+	reporter = None
+	try:
+		# start every worker, and load its segmenter, before taking requests
+		loop = asyncio.get_running_loop()
+		await asyncio.gather(*[loop.run_in_executor(batcher.m_Pool, segment_in_worker, [""]) for n in range(arguments.workers)])
+		service = SegmentService(batcher, recorder)
+		if arguments.unix_socket is not None:
+			server = await asyncio.start_unix_server(service.HandleConnection, path = arguments.unix_socket)
+			print ("Serving on", arguments.unix_socket, flush = True)
+		else:
+			server = await asyncio.start_server(service.HandleConnection, arguments.host, arguments.port)
+			print ("Serving on", "%s:%i" % (arguments.host, arguments.port), flush = True)
+		if arguments.report_interval > 0:
+			reporter = asyncio.create_task(report_periodically(recorder, arguments.report_interval))
+		async with server:
+			await server.serve_forever()
+	finally:
+		if reporter is not None:
+			reporter.cancel()
+		batcher.close()
+
+# ---------------------------------------------------------#
+# The load test: concurrency connections, each sending requests one after another until
+# requests have been sent in all, with texts drawn at random from the lines of a file.
+async def open_connection(arguments):
+	if arguments.unix_socket is not None:
+		return await asyncio.open_unix_connection(arguments.unix_socket)
+	return await asyncio.open_connection(arguments.host, arguments.port)
+
+async def send_request(reader, writer, method, path, request = None):
+	body = b"" if request is None else json.dumps(request).encode('utf-8')
+	writer.write(("%s %s HTTP/1.1\r\nHost: localhost\r\nContent-Length: %i\r\n\r\n" % (method, path, len(body))).encode('latin-1') + body)
+	await writer.drain()
+	status_line = await reader.readline()
+	headers = dict()
+	while True:
+		line = await reader.readline()
+		if line in (b"\r\n", b"\n", b""):
+			break
+		name, value = line.decode('latin-1').split(":", 1)
+		headers[name.strip().lower()] = value.strip()
+	reply = await reader.readexactly(int(headers["content-length"]))
+	return (int(status_line.split()[1]), json.loads(reply.decode('utf-8')))
+
+async def load_test(arguments):
+	if arguments.texts is not None:
+		with open(arguments.texts, encoding = 'utf-8') as infile:
+			texts = [line.strip() for line in infile if line.strip()]
+	else:
+		texts = ["thecatsatonthemat", "historyrepeatsitself", "colorlessgreenideassleepfuriously"]
+	random_generator = random.Random(arguments.seed)
+	remaining = [arguments.requests]
+	latencies = list()
+	failures = [0]
+	async def client():
+		reader, writer = await open_connection(arguments)
+		try:
+			while remaining[0] > 0:
+				remaining[0] -= 1
+				if arguments.batch > 1:
+					request = {"texts": random_generator.choices(texts, k = arguments.batch)}
+				else:
+					request = {"text": random_generator.choice(texts)}
+				start = time.perf_counter()
+				status, reply = await send_request(reader, writer, "POST", "/segment", request)
+				latencies.append(time.perf_counter() - start)
+				if status != 200:
+					failures[0] += 1
+		finally:
+			writer.close()
+	start = time.perf_counter()
+	await asyncio.gather(*[client() for n in range(arguments.concurrency)])
+	seconds = time.perf_counter() - start
+	latencies.sort()
+	reader, writer = await open_connection(arguments)
+	status, server_stats = await send_request(reader, writer, "GET", "/stats")
+	writer.close()
+	return {
+		"requests": len(latencies),
+		"failures": failures[0],
+		"seconds": round(seconds, 3),
+		"requests_per_second": round(len(latencies) / seconds, 1),
+		"p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+		"p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+		"server": server_stats,
+	}
+
+def main(argv = None):
+	argument_parser = argparse.ArgumentParser(description = "Serve a trained wordbreaker lexicon, or load-test the service.")
+	commands = argument_parser.add_subparsers(dest = "command", required = True)
+	serve_parser = commands.add_parser("serve", help = "run the service")
+	serve_parser.add_argument("lexicon", help = "the lexicon file wordbreaker wrote at the end (or a checkpoint); see lexicon_file.py")
+	serve_parser.add_argument("--workers", type = int, default = os.cpu_count() or 1, metavar = "N", help = "worker processes that do the segmenting")
+	serve_parser.add_argument("--batch-size", type = int, default = 64, metavar = "N", help = "most texts in a batch")
+	serve_parser.add_argument("--batch-wait", type = float, default = 2.0, metavar = "MS", help = "longest a text waits for its batch to fill, in milliseconds")
+	serve_parser.add_argument("--window", type = int, default = 10000, metavar = "N", help = "percentiles are over the last N requests")
+	serve_parser.add_argument("--report-interval", type = float, default = 0, metavar = "SECONDS", help = "print the stats this often (0: never)")
+	load_parser = commands.add_parser("load", help = "send requests to a running service, and report its latency")
+	load_parser.add_argument("--requests", type = int, default = 10000)
+	load_parser.add_argument("--concurrency", type = int, default = 32, metavar = "N", help = "connections sending requests at once")
+	load_parser.add_argument("--batch", type = int, default = 1, metavar = "N", help = "texts in each request")
+	load_parser.add_argument("--texts", default = None, metavar = "FILE", help = "draw the texts from the lines of this file")
+	load_parser.add_argument("--seed", type = int, default = 1)
+	for parser in (serve_parser, load_parser):
+		parser.add_argument("--host", default = "127.0.0.1")
+		parser.add_argument("--port", type = int, default = 8765)
+		parser.add_argument("--unix-socket", default = None, metavar = "PATH", help = "use this Unix socket instead of a port")
+	arguments = argument_parser.parse_args(argv)
+	if arguments.command == "serve":
+		try:
+			asyncio.run(serve(arguments))
+		except KeyboardInterrupt:
+			pass
+	else:
+		print (json.dumps(asyncio.run(load_test(arguments)), indent = 1))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,95 @@
+import math
+from array import array
+
+from wordbreaker import LexiconTrie, read_checkpoint
+from lexicon_file import LexiconFile, is_lexicon_file
+
+# ---------------------------------------------------------#
+# A trained lexicon, frozen, for breaking up text that it was not trained on:
+#	segmenter = load_segmenter("..._lexicon.bin")
+#	segmenter.segment("thecatsatonthemat")		-> ["the", "cat", "sat", "on", "the", "mat"]
+#	segmenter.segment_batch(lines)				-> a list like that for each line
+# It parses the way Lexicon.ParseWord does, with the costs the lexicon had when it was saved, but
+# it holds only the trie and the costs, and nothing changes them once it is made; so one segmenter
+# can serve any number of requests, and forked worker processes share it. The lexicon file keeps
+# the costs as float32, so near-ties between parses may go the other way than they do in ParseWord.
+# Spaces are removed from the text first, as they are from the corpus in ReadBrokenCorpus.
+# ---------------------------------------------------------#
+
+class Segmenter:
+	# trie: anything with Matches(word, start), like LexiconTrie or LexiconFile, that yields pieces;
+	# costs: the cost of each piece; keys: the key of each piece, if the pieces are not keys already.
+	def __init__(self, trie, costs, unknown_cost, keys = None):
+		self.m_Trie = trie
+		self.m_Costs = costs
+		self.m_UnknownCost = unknown_cost
+		self.m_Keys = keys
+	def __len__(self):
+		return len(self.m_Costs)
+	# the best parse of text, and its cost
+	def parse(self, text):
+		word = "".join(text.split())
+		wordlength = len(word)
+		BestCompressedLength = array('d', [math.inf]) * (wordlength + 1)
+		BestCompressedLength[0] = 0.0
+		LastChunk = [None] * (wordlength + 1)
+		LastChunkStartingPoint = array('l', [0]) * (wordlength + 1)
+		plog = self.m_Costs
+		for innerscan in range(wordlength):
+			for outerscan, Piece in self.m_Trie.Matches(word, innerscan):
+				newvalue = BestCompressedLength[innerscan] + plog[Piece]
+				if BestCompressedLength[outerscan] > newvalue:
+					BestCompressedLength[outerscan] = newvalue
+					LastChunk[outerscan] = Piece
+					LastChunkStartingPoint[outerscan] = innerscan
+			# nothing in the lexicon got us one letter further: take the letter on its own
+			if math.isinf(BestCompressedLength[innerscan + 1]):
+				BestCompressedLength[innerscan + 1] = BestCompressedLength[innerscan] + self.m_UnknownCost
+				LastChunk[innerscan + 1] = word[innerscan]
+				LastChunkStartingPoint[innerscan + 1] = innerscan
+		Parse = list()
+		position = wordlength
+		while position > 0:
+			Piece = LastChunk[position]
+			if self.m_Keys is not None and not isinstance(Piece, str):
+				Piece = self.m_Keys[Piece]
+			Parse.append(Piece)
+			position = LastChunkStartingPoint[position]
+		Parse.reverse()
+		return (Parse, BestCompressedLength[wordlength])
+	def segment(self, text):
+		return self.parse(text)[0]
+	def segment_batch(self, texts):
+		return [self.parse(text)[0] for text in texts]
+
+# ---------------------------------------------------------#
+# costs: entry to its cost, -log of its frequency, like Lexicon.m_EntryPlog.
+def segmenter_from_costs(costs):
+	trie = LexiconTrie()
+	finite_costs = dict()
+	for key, cost in costs.items():
+		if math.isinf(cost):
+			continue
+		finite_costs[key] = cost
+		trie.Insert(key, key)
+	# A letter the lexicon has never seen is a piece of its own, as costly as the costliest entry;
+	# otherwise no text that has one could be parsed at all.
+	return Segmenter(trie, finite_costs, max(finite_costs.values(), default = 0.0))
+
+def segmenter_from_lexicon(lexicon):
+	return segmenter_from_costs(lexicon.m_EntryPlog)
+
+# the costs of the entries in a checkpoint that wordbreaker wrote
+def checkpoint_costs(checkpoint):
+	costs = dict()
+	for key, count, frequency, count_register in checkpoint["entries"]:
+		costs[key] = -1 * math.log(frequency) if frequency > 0 else math.inf
+	return costs
+
+# From the lexicon file that wordbreaker writes at the end of a run (see lexicon_file.py), which is
+# mapped rather than read; or from a checkpoint that it wrote with --checkpoint-interval.
+def load_segmenter(filename):
+	if is_lexicon_file(filename):
+		lexicon_file = LexiconFile(filename)
+		return Segmenter(lexicon_file, lexicon_file.m_Costs, lexicon_file.m_UnknownCost, lexicon_file)
+	return segmenter_from_costs(checkpoint_costs(read_checkpoint(filename)))
@@ -0,0 +1,79 @@
+import os
+import copy
+import heapq
+import operator
+
+import pytest
+
+from test_parseword import trained_lexicon
+from iterated_parsings import TextParsingsWriter
+
+# m_BigramsByCount, kept up to date by SetParsedLine, has to give the same nominees as a scan of
+# every bigram count.
+def all_nominees(lexicon):
+	return sorted((nominee, count) for nominee, count in lexicon.m_BigramCounts.items()
+		if nominee not in lexicon.m_EntryDict and nominee not in lexicon.m_DeletionDict)
+
+def test_buckets_hold_every_nominee(tmp_path):
+	for compact in (False, True):
+		lexicon = trained_lexicon(str(tmp_path), compact, iterations = 6)
+		assert sorted(lexicon.EligibleNominees()) == all_nominees(lexicon)
+		# a nominee that becomes an entry is still in its bucket, and has to be left out
+		nominee, count = lexicon.EligibleNominees(1)[0]
+		lexicon.AddEntry(nominee, count)
+		assert nominee not in dict(lexicon.EligibleNominees())
+		assert sorted(lexicon.EligibleNominees()) == all_nominees(lexicon)
+
+def test_top_buckets_hold_the_cutoff(tmp_path):
+	lexicon = trained_lexicon(str(tmp_path), False, iterations = 6)
+	for howmany in (1, 5, 20, 1000):
+		expected = all_nominees(lexicon)
+		cutoff = heapq.nlargest(howmany, expected, key = operator.itemgetter(1))[-1][1]
+		nominees = lexicon.EligibleNominees(howmany)
+		assert set(item for item in expected if item[1] >= cutoff) == set(nominees)
+
+# whether changes takes count of each of two pieces that nominee splits into
+def is_split(changes, nominee, count):
+	for split in range(1, len(nominee)):
+		left, right = nominee[:split], nominee[split:]
+		expected = {left: -2 * count} if left == right else {left: -count, right: -count}
+		if changes == expected:
+			return True
+	return False
+
+def reparse(lexicon, iteration):
+	with open(os.devnull, "w") as null_file:
+		lexicon.ParseCorpus(null_file, TextParsingsWriter(null_file), iteration)
+
+# DescriptionLengthGain has to price the corpus the way ParseCorpus does. When adding a nominee
+# only turns each of its occurrences as two pieces into one piece, the gain it expected is what
+# m_CorpusCost + m_DictionaryLength go down by, once the corpus is reparsed with the counts that
+# came out of the new parse.
+def test_gain_is_the_change_in_description_length(tmp_path):
+	lexicon = trained_lexicon(str(tmp_path), False, iterations = 4)
+	# reparse until the costs are the ones the parse itself gives
+	reparse(lexicon, 4)
+	reparse(lexicon, 5)
+	before = lexicon.m_CorpusCost + lexicon.m_DictionaryLength
+	total_count = sum(entry.m_Count for entry in lexicon.m_EntryDict.values())
+	checked = 0
+	for nominee, count in heapq.nlargest(25, lexicon.EligibleNominees(), key = operator.itemgetter(1)):
+		gain = lexicon.DescriptionLengthGain(nominee, count, lexicon.m_NumberOfHypothesizedRunningWords, total_count)
+		with_nominee = copy.deepcopy(lexicon)
+		with_nominee.AddEntry(nominee, count)
+		with_nominee.ComputeDictFrequencies()
+		reparse(with_nominee, 6)
+		parse_counts = dict(with_nominee.m_ParseCounts)
+		reparse(with_nominee, 7)
+		if with_nominee.m_ParseCounts != parse_counts:
+			continue
+		changes = {word: parse_counts.get(word, 0) - lexicon.m_ParseCounts.get(word, 0)
+			for word in set(parse_counts) | set(lexicon.m_ParseCounts)}
+		changes = {word: change for word, change in changes.items() if change != 0}
+		# anything else the reparse did is more than the estimate looks at
+		if changes.pop(nominee, 0) != count or not is_split(changes, nominee, count):
+			continue
+		after = with_nominee.m_CorpusCost + with_nominee.m_DictionaryLength
+		assert gain == pytest.approx(before - after, abs = 1e-6)
+		checked += 1
+	assert checked >= 5
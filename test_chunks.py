@@ -0,0 +1,15 @@
+import random
+
+from wordbreaker import chunk_number, chunk_spans
+
+# chunk_spans walks the breakpoints once for all the spans, and has to find the chunks that
+# chunk_number finds for each end of each span on its own.
+def test_chunk_spans_agrees_with_chunk_number():
+	generator = random.Random(17)
+	for trial in range(500):
+		breakpoint_list = sorted(generator.sample(range(1, 40), generator.randrange(0, 12)))
+		breakpoint_list = [0] + breakpoint_list if generator.random() < 0.9 else breakpoint_list
+		spans = [(generator.randrange(0, 45), generator.randrange(1, 8)) for n in range(generator.randrange(0, 8))]
+		expected = [(chunk_number(breakpoint_list, start), chunk_number(breakpoint_list, start + length - 1))
+			for start, length in spans]
+		assert chunk_spans(breakpoint_list, spans) == expected
@@ -0,0 +1,32 @@
+import io
+import os
+
+from wordbreaker import Lexicon
+from test_parseword import SAMPLE
+
+def glossary(directory, run_size):
+	corpus_filename = os.path.join(directory, "sample.txt")
+	with open(corpus_filename, "w", encoding = 'utf-8') as outfile:
+		outfile.write(SAMPLE)
+	lexicon = Lexicon()
+	lexicon.g_encoding = "utf8"
+	lexicon.m_GlossaryRunSize = run_size
+	lexicon.ReadBrokenCorpus(corpus_filename)
+	outfile = io.StringIO()
+	lexicon.PrintBrokenCorpus(None, outfile)
+	return lexicon, outfile.getvalue()
+
+# However many runs the glossary records are spread over, the merged glossary lists every word
+# once, in sorted order, with its occurrences in the order of the corpus.
+def test_glossary_runs_merge_in_order(tmp_path):
+	lexicon, text = glossary(str(tmp_path), 7)
+	assert len(lexicon.m_GlossaryRuns) > 5
+	assert glossary(str(tmp_path), 1000000)[1] == text
+	expected = dict()
+	for lineno, line in enumerate(SAMPLE.replace('.', ' .').replace('?', ' ?').splitlines()):
+		position = 0
+		for word in line.split():
+			expected.setdefault(word, list()).append("%i:%i " % (lineno, position))
+			position += len(word)
+	assert text == "".join("%s %i\n%s\n" % (word, len(expected[word]), "".join(expected[word])) for word in sorted(expected))
+	assert ["%i:%i " % location for location in lexicon.GlossaryLocations("history")] == expected["history"]
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from iterated_parsings import BinaryParsingsWriter, IteratedParsings
+
+PARSES = [
+	[[0, 3, 6], [0, 2, 4, 7]],
+	[[0, 6], [0, 2, 4, 7]],
+	[[0, 6], [0, 7]],
+]
+
+def write_parsings(filename, snapshot_interval = None, close = True):
+	writer = BinaryParsingsWriter(filename, snapshot_interval)
+	for iteration, lines in enumerate(PARSES):
+		writer.StartIteration(iteration)
+		for line_number, breakpoint_list in enumerate(lines):
+			writer.WriteLine(line_number, breakpoint_list)
+	if close:
+		writer.close()
+	else:
+		writer.Checkpoint()
+	return writer
+
+@pytest.mark.parametrize("snapshot_interval", [None, 0, 2])
+def test_round_trip(tmp_path, snapshot_interval):
+	filename = str(tmp_path / "parsings.bin")
+	write_parsings(filename, snapshot_interval)
+	parsings = IteratedParsings(filename)
+	assert parsings.Iterations() == [0, 1, 2]
+	for iteration, lines in enumerate(PARSES):
+		for line_number, breakpoint_list in enumerate(lines):
+			assert parsings.BreakPoints(iteration, line_number) == breakpoint_list
+	parsings.close()
+
+def test_unclosed_writer_is_rejected(tmp_path):
+	filename = str(tmp_path / "parsings.bin")
+	writer = write_parsings(filename, close = False)
+	with pytest.raises(ValueError, match = "no index"):
+		IteratedParsings(filename)
+	writer.m_Outfile.close()
+
+def test_truncated_file_is_rejected(tmp_path):
+	filename = str(tmp_path / "parsings.bin")
+	write_parsings(filename)
+	for size in (os.path.getsize(filename) - 3, 20, 10):
+		with open(filename, "r+b") as outfile:
+			outfile.truncate(size)
+		with pytest.raises(ValueError):
+			IteratedParsings(filename)
@@ -0,0 +1,95 @@
+import os
+import math
+from array import array
+
+import pytest
+
+from wordbreaker import Lexicon, TrieKeyMarker
+from iterated_parsings import TextParsingsWriter
+
+# A fixed sample of segmented text; the lexicon is trained on it for a few iterations, so that
+# it has entries of many lengths and costs to choose between.
+SAMPLE = """\
+the cat sat on the mat and the dog sat on the log .
+a man and a woman went to the market to buy some bread .
+history repeats itself , first as tragedy and then as farce .
+the history of the world is the history of its people .
+she sells sea shells by the sea shore .
+to be or not to be , that is the question .
+in the beginning was the word and the word was with the reader .
+the quick brown fox jumps over the lazy dog .
+all the world is a stage and all the men and women merely players .
+they have their exits and their entrances and one man in his time plays many parts .
+the rain in spain stays mainly in the plain .
+what is the history of the word history ?
+peter piper picked a peck of pickled peppers .
+the cat and the hat went to the market with the dog .
+"""
+
+# ParseWord as it was before it used backpointers: each position keeps a copy of its whole
+# best partial parse.
+def ParseWordCopyingParses(lexicon, word):
+	wordlength = len(word)
+	Parse = [None] * (wordlength + 1)
+	Parse[0] = list()
+	BestCompressedLength = array('d', [math.inf]) * (wordlength + 1)
+	BestCompressedLength[0] = 0.0
+	LastChunk = [None] * (wordlength + 1)
+	LastChunkStartingPoint = [0] * (wordlength + 1)
+	root = lexicon.m_Trie.m_Root
+	plog = lexicon.PieceCosts()
+	for innerscan in range(wordlength):
+		if innerscan > 0:
+			Parse[innerscan] = list(Parse[LastChunkStartingPoint[innerscan]])
+			Parse[innerscan].append(LastChunk[innerscan])
+		node = root
+		for outerscan in range(innerscan + 1, wordlength + 1):
+			node = node.get(word[outerscan - 1])
+			if node is None:
+				break
+			if TrieKeyMarker not in node:
+				continue
+			Piece = node[TrieKeyMarker]
+			newvalue = BestCompressedLength[innerscan] + plog[Piece]
+			if BestCompressedLength[outerscan] > newvalue:
+				BestCompressedLength[outerscan] = newvalue
+				LastChunk[outerscan] = Piece
+				LastChunkStartingPoint[outerscan] = innerscan
+	if wordlength > 0:
+		Parse[wordlength] = list(Parse[LastChunkStartingPoint[wordlength]])
+		Parse[wordlength].append(LastChunk[wordlength])
+	return (Parse[wordlength], BestCompressedLength[wordlength])
+
+def trained_lexicon(directory, compact, iterations = 4):
+	corpus_filename = os.path.join(directory, "sample.txt")
+	with open(corpus_filename, "w", encoding = 'utf-8') as outfile:
+		outfile.write(SAMPLE)
+	lexicon = Lexicon()
+	lexicon.g_encoding = "utf8"
+	lexicon.m_CompactCorpus = compact
+	with open(os.devnull, "w") as null_file:
+		lexicon.ReadBrokenCorpus(corpus_filename)
+		parsings = TextParsingsWriter(null_file)
+		lexicon.ParseCorpus(null_file, parsings, 0)
+		for current_iteration in range(1, iterations):
+			lexicon.GenerateCandidates(20, None)
+			lexicon.ParseCorpus(null_file, parsings, current_iteration)
+	return lexicon
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_backpointers_give_the_same_parses(tmp_path, compact):
+	lexicon = trained_lexicon(str(tmp_path), compact)
+	assert any(len(key) > 2 for key in lexicon.m_EntryDict)
+	for line_number in range(len(lexicon.m_Corpus)):
+		line = lexicon.m_Corpus[line_number]
+		parse, cost = lexicon.ParseWord(line, None)
+		expected_parse, expected_cost = ParseWordCopyingParses(lexicon, line)
+		assert list(parse) == list(expected_parse)
+		assert cost == expected_cost
+		# and the pieces spell the line
+		assert "".join(lexicon.ParsedLineKeys(parse)) == lexicon.CorpusLine(line_number)
+
+def test_empty_word(tmp_path):
+	lexicon = trained_lexicon(str(tmp_path), False, iterations = 1)
+	assert lexicon.ParseWord("", None) == ([], 0.0)
+	assert ParseWordCopyingParses(lexicon, "") == ([], 0.0)
@@ -0,0 +1,57 @@
+import json
+import math
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from lexicon_file import write_lexicon_file
+from segment_service import LatencyRecorder, MicroBatcher, SegmentService, start_worker
+
+COSTS = {key: -math.log(frequency) for key, frequency in
+	{"the": 0.2, "cat": 0.1, "sat": 0.1, "on": 0.1, "mat": 0.1, "t": 0.01, "h": 0.01, "e": 0.01}.items()}
+
+def make_service(directory):
+	filename = str(directory / "lexicon.bin")
+	write_lexicon_file(filename, COSTS)
+	context = multiprocessing.get_context("fork")
+	make_pool = lambda: ProcessPoolExecutor(2, mp_context = context, initializer = start_worker, initargs = (filename,))
+	recorder = LatencyRecorder()
+	return SegmentService(MicroBatcher(make_pool, 8, 0.01, recorder), recorder)
+
+def post(service, request):
+	body = request if isinstance(request, bytes) else json.dumps(request).encode('utf-8')
+	return service.HandleRequest("POST", "/segment", dict(), body)
+
+# A bad request is refused on its own; it does not fail the requests it would have been batched with.
+def test_bad_requests_do_not_fail_their_batch(tmp_path):
+	async def run():
+		service = make_service(tmp_path)
+		try:
+			return await asyncio.gather(post(service, {"text": "thecatsat"}), post(service, {"texts": ["onthemat", 7]}),
+				post(service, {"text": None}), post(service, b"[1, 2]"), post(service, b"{"),
+				post(service, {"texts": ["thecat", "sat"]}))
+		finally:
+			service.m_Batcher.close()
+	replies = asyncio.run(run())
+	assert replies[0] == ("200 OK", {"words": ["the", "cat", "sat"]})
+	assert [status for status, reply in replies[1:5]] == ["400 Bad Request"] * 4
+	assert replies[5] == ("200 OK", {"words": [["the", "cat"], ["sat"]]})
+
+# When its workers die, the pool is replaced, and the service goes on answering.
+def test_service_survives_a_broken_pool(tmp_path):
+	async def run():
+		service = make_service(tmp_path)
+		batcher = service.m_Batcher
+		try:
+			assert await post(service, {"text": "thecat"}) == ("200 OK", {"words": ["the", "cat"]})
+			for process in list(batcher.m_Pool._processes.values()):
+				process.kill()
+				process.join()
+			reply = await post(service, {"text": "onthemat"})
+			return reply, await post(service, {"text": "sat"}), service.m_Recorder.m_PoolRestarts
+		finally:
+			batcher.close()
+	first, second, restarts = asyncio.run(run())
+	assert first == ("200 OK", {"words": ["on", "the", "mat"]})
+	assert second == ("200 OK", {"words": ["sat"]})
+	assert restarts == 1
@@ -8,7 +8,19 @@ import codecs # for utf8
 import string
 import copy
 import math
-from latexTable import MakeLatexTable
+import heapq
+import multiprocessing
+import argparse
+import json
+import functools
+import bisect
+import tracemalloc
+import tempfile
+from array import array
+from collections import OrderedDict
+from itertools import accumulate, groupby
+from iterated_parsings import TextParsingsWriter, BinaryParsingsWriter
+from lexicon_file import write_lexicon_file
 
 verboseflag = False
 
@@ -29,43 +41,221 @@ class Profile:
 		# the dict has sequences of words with spaces in between; its value is a count.
 
 #---------------------------------------------------------
+# m_CountRegister is the history of m_Count, kept flat: iteration number, count, iteration number, count...
 class LexiconEntry:
+	__slots__ = ("m_Key", "m_Count", "m_Frequency", "m_CountRegister")
 	def __init__(self, key = "", count = 0):
 		self.m_Key = key
 		self.m_Count = count
 		self.m_Frequency= 0.0
-		self.m_CountRegister = list()
+		self.m_CountRegister = array('d')
 		
 		
-	def ResetCounts(self, current_iteration):
+	# Only called for entries whose count changed since the last call; see Lexicon.m_ChangedCounts.
+	def RecordCount(self, current_iteration):
 		if len(self.m_CountRegister) > 0:
-			last_count = self.m_CountRegister[-1][1]
+			last_count = self.m_CountRegister[-1]
 			if self.m_Count != last_count:
-				self.m_CountRegister.append((current_iteration-1, self.m_Count))
+				self.m_CountRegister.extend((current_iteration-1, self.m_Count))
 		else:
-			self.m_CountRegister.append((current_iteration, self.m_Count))
-		self.m_Count = 0
+			self.m_CountRegister.extend((current_iteration, self.m_Count))
 	def Display(self, outfile):
 		print  ("%-20s" % self.m_Key, file = outfile)
-		for iteration_number, count in self.m_CountRegister:
+		for n in range(0, len(self.m_CountRegister), 2):
+			iteration_number, count = self.m_CountRegister[n], self.m_CountRegister[n + 1]
+			if count.is_integer():
+				count = int(count)
 			print ("%6i %10s" % (iteration_number, "{:,}".format(count)), file = outfile)
 # ---------------------------------------------------------#
+# A prefix trie over the keys of the lexicon. Each node is a dict from a letter to the next node;
+# a node where a lexicon entry ends also holds that entry's piece under TrieKeyMarker: its key,
+# or its integer ID when the corpus is encoded (then the letters are letter codes too).
+# ParseWord walks this instead of slicing and probing every substring of a line.
+TrieKeyMarker = None
+class LexiconTrie:
+	def __init__(self):
+		self.m_Root = dict()
+	def Insert(self, letters, piece):
+		node = self.m_Root
+		for letter in letters:
+			if letter not in node:
+				node[letter] = dict()
+			node = node[letter]
+		node[TrieKeyMarker] = piece
+	def Remove(self, letters):
+		path = list()
+		node = self.m_Root
+		for letter in letters:
+			if letter not in node:
+				return
+			path.append((node, letter))
+			node = node[letter]
+		node.pop(TrieKeyMarker, None)
+		# prune the branch back up to the last node that is still in use
+		for parent, letter in reversed(path):
+			if len(parent[letter]) > 0:
+				break
+			del parent[letter]
+	# yields (end position, piece) for every lexicon entry that starts at position start in word.
+	def Matches(self, word, start):
+		node = self.m_Root
+		for position in range(start, len(word)):
+			node = node.get(word[position])
+			if node is None:
+				return
+			if TrieKeyMarker in node:
+				yield (position + 1, node[TrieKeyMarker])
+# ---------------------------------------------------------#
+# The corpus, with each letter replaced by a small integer code, all in one array('H').
+# Line n is m_Buffer[m_LineOffsets[n]:m_LineOffsets[n+1]]. Indexing and iterating give the
+# codes of a line, which is what ParseWord reads; Line() gives it back as a string.
+class EncodedCorpus:
+	def __init__(self):
+		self.m_Codes = dict()     # letter to code
+		self.m_Letters = list()   # code to letter
+		self.m_Buffer = array('H')
+		self.m_LineOffsets = array('Q', [0])
+	def Encode(self, text):
+		codes = array('H')
+		for letter in text:
+			if letter not in self.m_Codes:
+				self.m_Codes[letter] = len(self.m_Letters)
+				self.m_Letters.append(letter)
+			codes.append(self.m_Codes[letter])
+		return codes
+	def Decode(self, codes):
+		return "".join([self.m_Letters[code] for code in codes])
+	def append(self, line):
+		self.m_Buffer.extend(self.Encode(line))
+		self.m_LineOffsets.append(len(self.m_Buffer))
+	def __len__(self):
+		return len(self.m_LineOffsets) - 1
+	def __getitem__(self, line_number):
+		return self.m_Buffer[self.m_LineOffsets[line_number]:self.m_LineOffsets[line_number + 1]]
+	def __iter__(self):
+		for line_number in range(len(self)):
+			yield self[line_number]
+	def Line(self, line_number):
+		return self.Decode(self[line_number])
+# ---------------------------------------------------------#
+# A list of lists of numbers, stored as one flat array plus the offset where each list starts.
+# m_TrueBreakPointList is one of these; each item comes back as an array.
+class FlatLists:
+	def __init__(self, typecode = 'L'):
+		self.m_Buffer = array(typecode)
+		self.m_Offsets = array('Q', [0])
+	def append(self, numbers):
+		self.m_Buffer.extend(numbers)
+		self.m_Offsets.append(len(self.m_Buffer))
+	def __len__(self):
+		return len(self.m_Offsets) - 1
+	def __getitem__(self, n):
+		return self.m_Buffer[self.m_Offsets[n]:self.m_Offsets[n + 1]]
+	def __iter__(self):
+		for n in range(len(self)):
+			yield self[n]
+# ---------------------------------------------------------#
+# What each stage of an iteration cost: wall and CPU seconds and, if trace_memory, the memory
+# it allocated (net, and at its peak), plus counters such as how many lines ParseWord parsed.
+# EndIteration writes it all out as a line of JSON. CPU time is this process's only, so it
+# leaves out the work of a pool of parsing processes.
+class StageMetrics:
+	def __init__(self, outfile, trace_memory = False):
+		self.m_Outfile = outfile
+		self.m_TraceMemory = trace_memory
+		self.m_Stages = dict()
+		self.m_Counters = dict()
+		self.m_Stack = list()  # [name, wall, cpu, memory at the start, peak of the stages inside it]
+		if trace_memory and not tracemalloc.is_tracing():
+			tracemalloc.start()
+	def StartStage(self, name):
+		memory = 0
+		if self.m_TraceMemory:
+			memory = tracemalloc.get_traced_memory()[0]
+			if len(self.m_Stack) > 0:
+				# the stage we are inside of still has to see the peak up to now
+				self.m_Stack[-1][4] = max(self.m_Stack[-1][4], tracemalloc.get_traced_memory()[1])
+			tracemalloc.reset_peak()
+		self.m_Stack.append([name, time.perf_counter(), time.process_time(), memory, 0])
+	def EndStage(self):
+		name, wall, cpu, memory, peak = self.m_Stack.pop()
+		if name not in self.m_Stages:
+			self.m_Stages[name] = {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "allocated_bytes": 0, "peak_bytes": 0}
+		stage = self.m_Stages[name]
+		stage["calls"] += 1
+		stage["wall_seconds"] += time.perf_counter() - wall
+		stage["cpu_seconds"] += time.process_time() - cpu
+		if self.m_TraceMemory:
+			current, traced_peak = tracemalloc.get_traced_memory()
+			peak = max(peak, traced_peak)
+			stage["allocated_bytes"] += current - memory
+			stage["peak_bytes"] = max(stage["peak_bytes"], peak)
+			if len(self.m_Stack) > 0:
+				self.m_Stack[-1][4] = max(self.m_Stack[-1][4], peak)
+	def Count(self, counter, n):
+		self.m_Counters[counter] = self.m_Counters.get(counter, 0) + n
+	def EndIteration(self, iteration):
+		print (json.dumps({"iteration": iteration, "stages": self.m_Stages, "counters": self.m_Counters}), file = self.m_Outfile)
+		self.m_Outfile.flush()
+		self.m_Stages = dict()
+		self.m_Counters = dict()
+
+# A Lexicon method with this goes on record as a stage of the iteration, when m_Metrics is on.
+def MeasuredStage(method):
+	@functools.wraps(method)
+	def measured_method(self, *args, **kwargs):
+		if self.m_Metrics is None:
+			return method(self, *args, **kwargs)
+		self.m_Metrics.StartStage(method.__name__)
+		try:
+			return method(self, *args, **kwargs)
+		finally:
+			self.m_Metrics.EndStage()
+	return measured_method
+# ---------------------------------------------------------#
 class Lexicon:
 	def __init__(self):
 		self.m_Profiles = Profiles("")
 		self.m_LetterDict=dict() 
 		self.m_LetterPlog = dict()
 		self.m_EntryDict = dict()
+		self.m_EntryPlog = dict()  # cost of each entry, -log of its frequency; only changes in ComputeDictFrequencies
+		self.m_EntryIds = dict()   # each entry's integer ID; IDs of deleted entries are not reused
+		self.m_EntryKeys = list()  # ID to key; a deleted entry keeps its key here, since an old parse may still use it
+		self.m_PlogById = array('d')  # m_EntryPlog by ID, when the corpus is encoded
+		self.m_Trie = LexiconTrie()  # index over the keys of m_EntryDict, kept in step with it
+		self.m_CompactCorpus = False  # True: m_Corpus is an EncodedCorpus, and parses are arrays of entry IDs
 		self.m_TrueDictionary = dict()
 		self.m_DictionaryLength = 0   #in bits! Check this is base 2, looks like default base in python
 		self.m_Corpus 	= list()
 		self.m_SizeOfLongestEntry = 0
 		self.m_CorpusCost = 0.0
-		self.m_Glossary = dict()
+		self.m_GlossaryRecords = list()  # (word, line number, start position) of the running words not yet in a run
+		self.m_GlossaryRuns = list()  # temporary files of those records, each sorted; see AddGlossaryRecord
+		self.m_GlossaryRunSize = 250000  # records to a run
 		self.m_ParsedCorpus = list()
+		self.m_ParseCounts = dict()  # how many times each entry is used in m_ParsedCorpus
+		self.m_BigramCounts = dict() # two adjacent pieces of a parse, run together: how often they occur in m_ParsedCorpus
+		self.m_BigramLines = dict()  # the same, but the lines where they occur
+		self.m_BigramsByCount = dict()  # count to the bigrams with that count that may still be nominated; see EligibleNominees
+		self.m_NewEntries = list()   # entries added since the last ParseCorpus
+		self.m_CandidateScoring = "count"  # "mdl": rank the nominees by DescriptionLengthGain instead of by count
+		self.m_LastCandidates = set()  # the entries the last GenerateCandidates added, until FilterZeroCountEntries
+		self.m_CandidateHistory = list()  # (iteration, candidates added, how many of them were deleted, other entries deleted)
+		self.m_ChangedCounts = set() # entries whose m_Count may have changed since ParseCorpus last recorded it
+		self.m_ChangedTallies = set() # entries whose m_ParseCounts changed in this ParseCorpus
+		self.m_ChangedMetricWords = set()  # entries whose m_Count changed, or that came or went, since UpdateWordMetrics
+		self.m_WordTruePositives = dict()  # for each entry in m_TrueDictionary, what it adds to m_TokenTruePositives
+		self.m_TokenTruePositives = 0
+		self.m_TypeTruePositives = 0
+		self.m_CheckWordMetrics = False  # True: RecallPrecision also recomputes the word metrics from scratch, to compare
+		self.m_IncrementalParsing = False
+		self.m_ResyncInterval = 0
+		self.m_ReparsedLinesHistory = list()
 		self.m_NumberOfHypothesizedRunningWords = 0
+		self.m_NumberOfSoftRunningWords = 0.0  # expected number of words, in "em" mode
 		self.m_NumberOfTrueRunningWords = 0
-		self.m_TrueBreakPointList = list()
+		self.m_TrueBreakPointList = FlatLists()
 		self.m_DeletionList = list()  # these are the words that were nominated and then not used in any line-parses *at all*.
 		self.m_DeletionDict = dict()  # They never stop getting nominated.
 		self.m_Break_based_RecallPrecisionHistory = list()
@@ -73,27 +263,96 @@ class Lexicon:
 		self.m_Type_based_RecallPrecisionHistory = list()
 		self.m_DictionaryLengthHistory = list()
 		self.m_CorpusCostHistory = list()
+		self.m_NumberOfWorkers = 1  # more than 1: ParseCorpus parses in a pool of processes
+		self.m_ParseCache = OrderedDict()  # line to (parse, bit cost) under the current costs, least recently used first
+		self.m_ParseCacheSize = 100000     # most lines m_ParseCache holds; 0 turns it off
+		self.m_Metrics = None  # a StageMetrics, to record what each stage costs
+		self.m_TrainingMode = "viterbi"  # "em": count with Expectation instead of the best parses
 		self.g_encoding = ""
 	# ---------------------------------------------------------#
 	# ---------------------------------------------------------#
 	def AddEntry(self,key,count):
 		this_entry = LexiconEntry(key,count)
 		self.m_EntryDict[key] = this_entry
+		self.IndexEntry(key)
+		self.m_NewEntries.append(key)
 		if len(key) > self.m_SizeOfLongestEntry:
 			self.m_SizeOfLongestEntry = len(key)
+	# ---------------------------------------------------------#
+	# Gives a new entry its ID and puts it in the trie.
+	def IndexEntry(self, key):
+		self.m_EntryIds[key] = len(self.m_EntryKeys)
+		self.m_EntryKeys.append(key)
+		self.NoteCountChange(key)
+		if self.m_CompactCorpus:
+			self.m_Trie.Insert(self.m_Corpus.Encode(key), self.m_EntryIds[key])
+		else:
+			self.m_Trie.Insert(key, key)
+	def UnindexEntry(self, key):
+		if self.m_CompactCorpus:
+			self.m_Trie.Remove(self.m_Corpus.Encode(key))
+		else:
+			self.m_Trie.Remove(key)
+		del self.m_EntryIds[key]
+		self.m_ChangedMetricWords.add(key)
+	# Every change to an entry's m_Count after it is indexed goes through here.
+	def NoteCountChange(self, key):
+		self.m_ChangedCounts.add(key)
+		self.m_ChangedMetricWords.add(key)
+	# ---------------------------------------------------------#
+	# A piece is what ParseWord puts in a parse: the entry's key, or its ID if the corpus is encoded.
+	def ParsedLineKeys(self, parsed_line):
+		if self.m_CompactCorpus:
+			return [self.m_EntryKeys[piece] for piece in parsed_line]
+		return parsed_line
+	def ChunkLengths(self, parsed_line):
+		if self.m_CompactCorpus:
+			return [len(self.m_EntryKeys[piece]) for piece in parsed_line]
+		return [len(piece) for piece in parsed_line]
+	# the table that gives the cost of a piece
+	def PieceCosts(self):
+		if self.m_CompactCorpus:
+			return self.m_PlogById
+		return self.m_EntryPlog
+	def CorpusLine(self, line_number):
+		if self.m_CompactCorpus:
+			return self.m_Corpus.Line(line_number)
+		return self.m_Corpus[line_number]
 	# ---------------------------------------------------------#	
 	# Found bug here July 5 2015: important, don't let it remove a singleton letter! John
+	@MeasuredStage
 	def FilterZeroCountEntries(self, iteration_number):
+		deleted_candidates = 0
+		deleted_others = 0
 		for key, entry in list(self.m_EntryDict.items()):
 			if len(key) == 1:
-				entry.m_Count = 1
+				if entry.m_Count != 1:
+					entry.m_Count = 1
+					self.NoteCountChange(key)
 				continue
 			if entry.m_Count == 0:
 				self.m_DeletionList.append((key, iteration_number))
 				self.m_DeletionDict[key] = 1
 				self.m_EntryDict.pop(key)
+				self.UnindexEntry(key)
 				print ("Excluding this bad candidate: ", key)
+				if key in self.m_LastCandidates:
+					deleted_candidates += 1
+				else:
+					deleted_others += 1
+		# how many of this iteration's candidates were not worth the parse they cost
+		self.m_CandidateHistory.append((iteration_number, len(self.m_LastCandidates), deleted_candidates, deleted_others))
+		print ("Candidates deleted: ", deleted_candidates, "of", len(self.m_LastCandidates), "added;", deleted_others, "older entries deleted")
+		if self.m_Metrics is not None:
+			self.m_Metrics.Count("candidates added", len(self.m_LastCandidates))
+			self.m_Metrics.Count("candidates deleted", deleted_candidates)
+		self.m_LastCandidates = set()
 	# ---------------------------------------------------------#
+	# Both readers go through the file a line at a time, so the text is never all in memory at
+	# once. What they build from it is, though: m_Corpus (strings, or an EncodedCorpus with
+	# --compact) and the true breakpoints; and ParseCorpus keeps a parse of every line besides.
+	# So the corpus still has to fit in memory, in that form. The glossary does not: it goes
+	# to temporary files as it is read.
 	def ReadCorpus(self, infilename):
 		print ("Name of data file: ", infilename)
 		if not os.path.isfile(infilename):
@@ -102,20 +361,27 @@ class Lexicon:
 			infile = codecs.open(infilename, encoding = 'utf-8')
 		else:
 			infile = open(infilename) 	 
-		self.m_Corpus = infile.readlines() # bad code if the corpus is very large -- but then we won't use python.
-		for line in self.m_Corpus:			 		 
+		if self.m_CompactCorpus:
+			self.m_Corpus = EncodedCorpus()
+		else:
+			self.m_Corpus = list()
+		for line in infile:
+			self.m_Corpus.append(line)
 			for letter in line:
 				if letter not in self.m_EntryDict:
 					this_lexicon_entry = LexiconEntry()
 					this_lexicon_entry.m_Key = letter
 					this_lexicon_entry.m_Count = 1
 					self.m_EntryDict[letter] = this_lexicon_entry					 
+					self.IndexEntry(letter)
 				else:
 					self.m_EntryDict[letter].m_Count += 1
 		self.m_SizeOfLongestEntry = 1	
 		self.ComputeDictFrequencies()
 	# ---------------------------------------------------------#
-	def ReadBrokenCorpus(self, infilename, numberoflines= 0):
+	# Reads the corpus a line at a time. If outfile is given, each processed line is written to it
+	# as soon as it is read (as PrintBrokenCorpus would), so PrintBrokenCorpus need not do it.
+	def ReadBrokenCorpus(self, infilename, numberoflines= 0, outfile = None):
 
 		print ("Name of data file: ", infilename)
 		if not os.path.isfile(infilename):
@@ -125,9 +391,10 @@ class Lexicon:
 		else:
 			infile = open(infilename) 	 
 		 
-		rawcorpus_list = infile.readlines() # bad code if the corpus is very large -- but then we won't use python.
+		if self.m_CompactCorpus:
+			self.m_Corpus = EncodedCorpus()
 		lineno = -1
-		for line in rawcorpus_list:					 	 
+		for line in infile:					 	 
 			this_line = ""
 			breakpoint_list = list()
 			breakpoint_list.append(0)
@@ -147,18 +414,18 @@ class Lexicon:
 				startpoint = len(this_line)
 				this_line += word
 				breakpoint_list.append(len(this_line))
-				if  word not in self.m_Glossary:
-					self.m_Glossary[word]= list()
-				self.m_Glossary[word].append((lineno, startpoint)) 
-				#print (word, self.m_Glossary[word])	
+				self.AddGlossaryRecord(word, lineno, startpoint)
 			self. m_Corpus.append(this_line)
 			self.m_TrueBreakPointList.append(breakpoint_list)
+			if outfile is not None:
+				self.PrintProcessedLine(lineno, outfile)
 			for letter in line:
 				if letter not in self.m_EntryDict:
 					this_lexicon_entry = LexiconEntry()
 					this_lexicon_entry.m_Key = letter
 					this_lexicon_entry.m_Count = 1
 					self.m_EntryDict[letter] = this_lexicon_entry					 
+					self.IndexEntry(letter)
 				else:
 					self.m_EntryDict[letter].m_Count += 1	
 				if letter not in self.m_LetterDict:
@@ -170,8 +437,34 @@ class Lexicon:
 			
 		print ("number of lines", len(self.m_Corpus))
 		print ("number of breakpoint lines", len(self.m_TrueBreakPointList))
+		infile.close()
 		self.m_SizeOfLongestEntry = 1	
 		self.ComputeDictFrequencies()
+	# ---------------------------------------------------------#
+	# The glossary is sorted the way external sorts are: once m_GlossaryRunSize records have come
+	# in, they are sorted and written out as a run, and PrintBrokenCorpus merges the runs. So only
+	# one run is ever in memory, whatever the size of the corpus.
+	def AddGlossaryRecord(self, word, lineno, startpoint):
+		self.m_GlossaryRecords.append((word, lineno, startpoint))
+		if len(self.m_GlossaryRecords) >= self.m_GlossaryRunSize:
+			self.m_GlossaryRecords.sort()
+			run = tempfile.TemporaryFile("w+", encoding = 'utf-8')
+			for record in self.m_GlossaryRecords:
+				print (*record, sep = '\t', file = run)
+			self.m_GlossaryRuns.append(run)
+			self.m_GlossaryRecords = list()
+	def ReadGlossaryRun(self, run):
+		run.seek(0)
+		for line in run:
+			word, lineno, startpoint = line.rstrip('\n').split('\t')
+			yield (word, int(lineno), int(startpoint))
+	# All the glossary records, sorted by word, and each word's in the order they occur in.
+	def GlossaryRecords(self):
+		self.m_GlossaryRecords.sort()
+		return heapq.merge(*[self.ReadGlossaryRun(run) for run in self.m_GlossaryRuns], self.m_GlossaryRecords)
+	# the (line number, start position) of each occurrence of word; this reads the whole glossary
+	def GlossaryLocations(self, word):
+		return [(lineno, startpoint) for this_word, lineno, startpoint in self.GlossaryRecords() if this_word == word]
 # ---------------------------------------------------------#
 	def PrintBrokenCorpus (self, outfile, outfile_glossary ):
 		# Two parts to this output:
@@ -182,38 +475,56 @@ class Lexicon:
 		# Each word is a single line,  of line number plus initial starting point for
 		#	 each real word in the corpus
 		# Sept 17 2023 made the list into a string....
-		lineno = 0
-		for line in self.m_Corpus:
-			print (lineno, ":", line, sep='', file = outfile)  
-			newlist = list()
-			for number in self.m_TrueBreakPointList[lineno]:
-				newlist.append (str(number))
-			#print ("\n", 191, ' '.join(newlist) )
-			print ( ' '.join(newlist), file = outfile)		 
-			lineno += 1
+		# outfile is None if ReadBrokenCorpus already wrote the first part.
+		if outfile is not None:
+			for lineno in range(len(self.m_Corpus)):
+				self.PrintProcessedLine(lineno, outfile)
 		#print ("#@#", file = outfile)
 	 
-		for word, hits in sorted(self.m_Glossary.items()):
+		for word, records in groupby(self.GlossaryRecords(), key = operator.itemgetter(0)):
 			print (word, self.m_TrueDictionary[word], file = outfile_glossary)
-			for item in self.m_Glossary[word]:
-				print (item[0], ':', item[1], ' ',  file = outfile_glossary, end='', sep='')
+			for item in records:
+				print (item[1], ':', item[2], ' ',  file = outfile_glossary, end='', sep='')
 			print (file=outfile_glossary)
 		#outfile.close()
+	def PrintProcessedLine(self, lineno, outfile):
+		print (lineno, ":", self.CorpusLine(lineno), sep='', file = outfile)  
+		newlist = list()
+		for number in self.m_TrueBreakPointList[lineno]:
+			newlist.append (str(number))
+		#print ("\n", 191, ' '.join(newlist) )
+		print ( ' '.join(newlist), file = outfile)		 
  # ---------------------------------------------------------#
+	@MeasuredStage
 	def ComputeDictFrequencies(self):
 		TotalCount = 0
 		for (key, entry) in self.m_EntryDict.items():
 			TotalCount += entry.m_Count
 		for (key, entry) in self.m_EntryDict.items():
 			entry.m_Frequency = entry.m_Count/float(TotalCount)
+		self.ComputeEntryPlogs()
 		TotalCount = 0
 		for (letter, count) in self.m_LetterDict.items():
 			TotalCount += count
 		for (letter, count) in self.m_LetterDict.items():
 			self.m_LetterDict[letter] = float(count)/float(TotalCount)
 			self.m_LetterPlog[letter] = -1 * math.log(self.m_LetterDict[letter])
+# ---------------------------------------------------------#
+	def ComputeEntryPlogs(self):
+		self.m_ParseCache.clear()  # the parses in it were best under the old costs
+		self.m_EntryPlog = dict()
+		for (key, entry) in self.m_EntryDict.items():
+			if entry.m_Frequency > 0:
+				self.m_EntryPlog[key] = -1 * math.log(entry.m_Frequency)
+			else:
+				self.m_EntryPlog[key] = math.inf
+		if self.m_CompactCorpus:
+			self.m_PlogById = array('d', [math.inf]) * len(self.m_EntryKeys)
+			for (key, plog) in self.m_EntryPlog.items():
+				self.m_PlogById[self.m_EntryIds[key]] = plog
 # ---------------------------------------------------------#
 	# added july 2015 john
+	@MeasuredStage
 	def ComputeDictionaryLength(self):
 		DictionaryLength = 0
 		for word in self.m_EntryDict:
@@ -226,33 +537,80 @@ class Lexicon:
 		self.m_DictionaryLengthHistory.append(DictionaryLength)
 			 
 # ---------------------------------------------------------#
+	# outfile_parsings is one of the writers in iterated_parsings.
+	@MeasuredStage
 	def ParseCorpus(self, outfile, outfile_parsings, current_iteration):
-		print  ("#current_iteration# ", current_iteration, file = outfile_parsings )
+		outfile_parsings.StartIteration(current_iteration)
 		#print ("current interation", current_iteration)
-		self.m_ParsedCorpus = list()
 		self.m_CorpusCost = 0.0	
-		self.m_NumberOfHypothesizedRunningWords = 0
 		#total_word_count_in_parse = 0	 
-		for word, lexicon_entry in self.m_EntryDict.items():
-			lexicon_entry.ResetCounts(current_iteration)
-		line_number = 0
-		for line in self.m_Corpus:	
-			#print (line)
-			chunks = list()
-			parsed_line,bit_cost = 	self.ParseWord(line, outfile)	
-			self.m_ParsedCorpus.append(parsed_line)
-			self.m_CorpusCost += bit_cost
-			for word in parsed_line:
-				length = len(word)
-				chunks.append(length)
-				self.m_EntryDict[word].m_Count +=1
-				self.m_NumberOfHypothesizedRunningWords += 1
+		# An entry's m_Count only needs recording, and setting again from the parse, if it changed
+		# somewhere since last time; the rest of the lexicon is left alone.
+		changed_counts = self.m_ChangedCounts
+		self.m_ChangedCounts = set()
+		self.m_ChangedTallies = set()
+		for word in changed_counts:
+			if word in self.m_EntryDict:
+				self.m_EntryDict[word].RecordCount(current_iteration)
+		if len(self.m_ParsedCorpus) != len(self.m_Corpus):
+			self.m_ParsedCorpus = [list() for line_number in range(len(self.m_Corpus))]
+			self.m_ParseCounts = dict()
+			self.m_BigramCounts = dict()
+			self.m_BigramLines = dict()
+			self.m_BigramsByCount = dict()
+			self.m_NumberOfHypothesizedRunningWords = 0
+		line_numbers = self.LinesToReparse(current_iteration)
+		self.m_NewEntries = list()
+		if self.m_NumberOfWorkers > 1:
+			shards = self.ParseCorpusInParallel(line_numbers)
+		else:
+			shards = [self.ParseLines(line_numbers)]
+		start = 0
+		cache_hits = 0
+		changed_lines = list()  # the lines whose parse is not what it was, in order
+		for parsed_lines, bit_costs, hits, work in shards:
+			cache_hits += hits
+			if self.m_Metrics is not None:
+				for counter, n in zip(("lines parsed", "lexicon probes", "lexicon matches"), work):
+					self.m_Metrics.Count(counter, n)
+			for line_number, parsed_line, bit_cost in zip(line_numbers[start:start + len(parsed_lines)], parsed_lines, bit_costs):
+				if self.SetParsedLine(line_number, parsed_line):
+					changed_lines.append(line_number)
+				self.m_CorpusCost += bit_cost
+			start += len(parsed_lines)
+		if len(line_numbers) < len(self.m_Corpus):
+			# the lines we did not reparse keep their parse, but not their old cost
+			self.m_CorpusCost = 0.0
+			for word, count in self.m_ParseCounts.items():
+				self.m_CorpusCost += count * self.m_EntryPlog[word]
+		self.m_ReparsedLinesHistory.append((current_iteration, len(line_numbers)))
+		print ("Lines reparsed: ", "{:,}".format(len(line_numbers)), "of", "{:,}".format(len(self.m_Corpus)))
+		if self.m_ParseCacheSize > 0 and len(line_numbers) > 0:
+			print ("Parse cache hit rate: ", "{:.1%}".format(cache_hits / len(line_numbers)))
+		# an iteration of a delta history only stores the lines whose parse changed
+		if outfile_parsings.WritesEveryLine():
+			lines_to_write = range(len(self.m_ParsedCorpus))
+		else:
+			lines_to_write = changed_lines
+		for line_number in lines_to_write:
+			chunks = self.ChunkLengths(self.m_ParsedCorpus[line_number])
 			breakpoint_list = chunks2breakpoints(chunks)
-			print (line_number, ':', sep='', file = outfile_parsings, end = '')
-			print (*breakpoint_list, sep=' ', file = outfile_parsings)
-			line_number+= 1
-		self.FilterZeroCountEntries(current_iteration)
-		self.ComputeDictFrequencies()
+			outfile_parsings.WriteLine(line_number, breakpoint_list)
+		for word in changed_counts | self.m_ChangedTallies:
+			if word in self.m_EntryDict:
+				count = self.m_ParseCounts.get(word, 0)
+				if self.m_EntryDict[word].m_Count != count:
+					self.m_EntryDict[word].m_Count = count
+					self.NoteCountChange(word)
+		if self.m_TrainingMode == "em":
+			start_time = time.time()
+			self.Expectation()
+			print ("Expectation: ", "{:.2f}".format(time.time() - start_time), "seconds")
+			self.FilterZeroCountEntries(current_iteration)
+			self.Maximization()
+		else:
+			self.FilterZeroCountEntries(current_iteration)
+			self.ComputeDictFrequencies()
 		self.ComputeDictionaryLength()
 		print ("\nCorpus     cost: ", "{:,}".format(int(self.m_CorpusCost)))
 		print ("Dictionary cost: ", "{:,}".format(int(self.m_DictionaryLength)))
@@ -262,163 +620,509 @@ class Lexicon:
 		print ("Dictionary cost: ", "{:,}".format(self.m_DictionaryLength), file = outfile)
 		print ("Total description length: ", "{:,}".format(self.m_CorpusCost + self.m_DictionaryLength), file = outfile)
 		return  
+# ---------------------------------------------------------#
+	# Parses the lines whose numbers are in line_numbers. Returns their parses, the bit cost of each,
+	# how many of them were found in m_ParseCache, and (when m_Metrics is on) how much work
+	# ParseWord did: lines, lexicon probes, lexicon matches, as ParseWord counts them. A line that occurs more than once
+	# is only parsed the first time, and the lines share the parse.
+	def ParseLines(self, line_numbers):
+		parsed_lines = list()
+		bit_costs = list()
+		hits = 0
+		work = [0, 0, 0]
+		for line_number in line_numbers:
+			line = self.m_Corpus[line_number]
+			if self.m_CompactCorpus:
+				line = line.tobytes()
+			if line in self.m_ParseCache:
+				self.m_ParseCache.move_to_end(line)
+				parsed_line, bit_cost = self.m_ParseCache[line]
+				hits += 1
+			else:
+				parsed_line,bit_cost = 	self.ParseWord(self.m_Corpus[line_number], None, work if self.m_Metrics is not None else None)
+				if self.m_CompactCorpus:
+					parsed_line = array('I', parsed_line)
+				if self.m_ParseCacheSize > 0:
+					self.m_ParseCache[line] = (parsed_line, bit_cost)
+					if len(self.m_ParseCache) > self.m_ParseCacheSize:
+						self.m_ParseCache.popitem(last = False)
+			parsed_lines.append(parsed_line)
+			bit_costs.append(bit_cost)
+		return (parsed_lines, bit_costs, hits, work)
+	# Writes out the metrics of this iteration, if m_Metrics is on.
+	def EndIterationMetrics(self, current_iteration):
+		if self.m_Metrics is not None:
+			self.m_Metrics.EndIteration(current_iteration)
+# ---------------------------------------------------------#
+	# Which lines ParseCorpus has to parse this time. Normally that is all of them. In incremental
+	# mode, a line keeps its old parse unless two adjacent pieces of it were just merged into a
+	# new entry. Such a line could still come out differently under the new costs, so every
+	# m_ResyncInterval iterations (if that is not 0) we reparse everything anyway.
+	def LinesToReparse(self, current_iteration):
+		numberoflines = len(self.m_Corpus)
+		if not self.m_IncrementalParsing or self.m_NumberOfHypothesizedRunningWords == 0:
+			return range(numberoflines)
+		if self.m_ResyncInterval > 0 and current_iteration % self.m_ResyncInterval == 0:
+			return range(numberoflines)
+		# an entry that is still used in some parse can only have been deleted in "em" mode,
+		# if its soft count came to nothing; we do not know which lines use it
+		for key in self.m_ParseCounts:
+			if key not in self.m_EntryDict:
+				return range(numberoflines)
+		dirty_lines = set()
+		for key in self.m_NewEntries:
+			if key in self.m_BigramLines:
+				dirty_lines.update(self.m_BigramLines[key])
+		return sorted(dirty_lines)
+# ---------------------------------------------------------#
+	# Replaces the parse of a line, and moves the entry counts, the bigram counts and the
+	# bigram index from the old parse to the new one. Returns whether the parse changed.
+	def SetParsedLine(self, line_number, parsed_line):
+		old_parsed_line = self.m_ParsedCorpus[line_number]
+		if parsed_line == old_parsed_line:
+			return False
+		self.m_ParsedCorpus[line_number] = parsed_line
+		old_parsed_line = self.ParsedLineKeys(old_parsed_line)
+		parsed_line = self.ParsedLineKeys(parsed_line)
+		self.m_ChangedTallies.update(old_parsed_line)
+		self.m_ChangedTallies.update(parsed_line)
+		for word in old_parsed_line:
+			self.m_ParseCounts[word] -= 1
+			if self.m_ParseCounts[word] == 0:
+				del self.m_ParseCounts[word]
+		for word in parsed_line:
+			if word in self.m_ParseCounts:
+				self.m_ParseCounts[word] += 1
+			else:
+				self.m_ParseCounts[word] = 1
+		self.m_NumberOfHypothesizedRunningWords += len(parsed_line) - len(old_parsed_line)
+		old_bigrams = set(Bigrams(old_parsed_line))
+		new_bigrams = set(Bigrams(parsed_line))
+		counts_before = dict()
+		for bigram in old_bigrams | new_bigrams:
+			counts_before[bigram] = self.m_BigramCounts.get(bigram, 0)
+		for bigram in Bigrams(old_parsed_line):
+			self.m_BigramCounts[bigram] -= 1
+			if self.m_BigramCounts[bigram] == 0:
+				del self.m_BigramCounts[bigram]
+		for bigram in Bigrams(parsed_line):
+			if bigram in self.m_BigramCounts:
+				self.m_BigramCounts[bigram] += 1
+			else:
+				self.m_BigramCounts[bigram] = 1
+		for bigram, count in counts_before.items():
+			self.MoveBigram(bigram, count, self.m_BigramCounts.get(bigram, 0))
+		for bigram in old_bigrams - new_bigrams:
+			lines = self.m_BigramLines[bigram]
+			lines.discard(line_number)
+			if len(lines) == 0:
+				del self.m_BigramLines[bigram]
+		for bigram in new_bigrams - old_bigrams:
+			if bigram not in self.m_BigramLines:
+				self.m_BigramLines[bigram] = set()
+			self.m_BigramLines[bigram].add(line_number)
+		return True
+	# Moves bigram to the bucket of its new count in m_BigramsByCount.
+	def MoveBigram(self, bigram, old_count, new_count):
+		if old_count == new_count:
+			return
+		if old_count in self.m_BigramsByCount:
+			bucket = self.m_BigramsByCount[old_count]
+			bucket.discard(bigram)
+			if len(bucket) == 0:
+				del self.m_BigramsByCount[old_count]
+		if new_count > 0 and bigram not in self.m_EntryDict and bigram not in self.m_DeletionDict:
+			if new_count not in self.m_BigramsByCount:
+				self.m_BigramsByCount[new_count] = set()
+			self.m_BigramsByCount[new_count].add(bigram)
+	# The bigrams that are not entries and were never deleted, as (nominee, count), from the most
+	# frequent down: all of them, or with howmany, just those with at least the count of the
+	# howmany-th. So we only look at the top of m_BigramsByCount. A bigram that has become an
+	# entry, or been deleted, since it went into its bucket is dropped from it when we come to it;
+	# it can never be nominated again, since an entry only leaves the lexicon by being deleted.
+	def EligibleNominees(self, howmany = None):
+		Nominees = list()
+		for count in sorted(self.m_BigramsByCount, reverse = True):
+			bucket = self.m_BigramsByCount[count]
+			for bigram in [bigram for bigram in bucket if bigram in self.m_EntryDict or bigram in self.m_DeletionDict]:
+				bucket.discard(bigram)
+			if len(bucket) == 0:
+				del self.m_BigramsByCount[count]
+				continue
+			for nominee in bucket:
+				Nominees.append((nominee, count))
+			if howmany is not None and len(Nominees) >= howmany:
+				break
+		return Nominees
+# ---------------------------------------------------------#
+	# Where a bigram first occurs in m_ParsedCorpus, as (line number, piece number).
+	def FirstOccurrence(self, bigram):
+		line_number = min(self.m_BigramLines[bigram])
+		for wordno, this_bigram in enumerate(Bigrams(self.ParsedLineKeys(self.m_ParsedCorpus[line_number]))):
+			if this_bigram == bigram:
+				return (line_number, wordno)
+# ---------------------------------------------------------#
+	# Splits line_numbers into consecutive shards and parses them in a pool of m_NumberOfWorkers
+	# processes. The pool is forked after the costs for this iteration are computed, so each
+	# worker sees this lexicon copy-on-write and nothing but line numbers is sent to it.
+	# The shards come back in corpus order.
+	def ParseCorpusInParallel(self, line_numbers):
+		global g_worker_lexicon
+		numberoflines = len(line_numbers)
+		shardsize = max(1, -(-numberoflines // (4 * self.m_NumberOfWorkers)))
+		shards = [line_numbers[first:first + shardsize] for first in range(0, numberoflines, shardsize)]
+		g_worker_lexicon = self
+		try:
+			with multiprocessing.get_context("fork").Pool(self.m_NumberOfWorkers) as pool:
+				return pool.map(ParseShard, shards)
+		finally:
+			g_worker_lexicon = None
 # ---------------------------------------------------------#		 	 
 	def PrintParsedCorpus(self,outfile):
 		for line in self.m_ParsedCorpus:
-			PrintList(line,outfile)		
+			PrintList(self.ParsedLineKeys(line),outfile)		
 # ---------------------------------------------------------#
 	
 # ---------------------------------------------------------#
-	def ParseWord(self, word, outfile):
+	# If work is given, ParseWord adds to it what it did: one line, the trie nodes it looked up,
+	# and how many of them ended an entry.
+	def ParseWord(self, word, outfile, work = None):
 		wordlength = len(word)
-		Parse = dict()	 
-		Piece = ""	
-		LastChunk = ""		 
-		BestCompressedLength = dict()
-		BestCompressedLength[0] = 0
-		CompressedSizeFromInnerScanToOuterScan = 0.0
-		LastChunkStartingPoint = 0
+		BestCompressedLength = array('d', [math.inf]) * (wordlength + 1)	# inf: nothing reaches this position yet
+		BestCompressedLength[0] = 0.0
+		LastChunk = [None] * (wordlength + 1)
+		LastChunkStartingPoint = array('l', [0]) * (wordlength + 1)
 		# <------------------ outerscan -----------><------------------> #
 		#                  ^---starting point
 		# <----prefix?----><----innerscan---------->
 		#                  <----Piece-------------->
-		if verboseflag: print >>outfile, "\nOuter\tInner"
-		if verboseflag: print >>outfile, "scan:\tscan:\tPiece\tFound?"
-		for outerscan in range(1,wordlength+1):  
-			Parse[outerscan] = list()
-			MinimumCompressedSize= 0.0
-			startingpoint = 0
-			if outerscan > self.m_SizeOfLongestEntry:
-				startingpoint = outerscan - self.m_SizeOfLongestEntry
-			for innerscan in range(startingpoint, outerscan):
-				if verboseflag: print >>outfile,  "\n %3s\t%3s  " %(outerscan, innerscan),				 
-				Piece = word[innerscan: outerscan]	 
-				if verboseflag: print >>outfile, " %5s"% Piece, 			 
-				if Piece in self.m_EntryDict:		
-					if verboseflag: print >>outfile,"   %5s" % "Yes.",		 
-					CompressedSizeFromInnerScanToOuterScan = -1 * math.log( self.m_EntryDict[Piece].m_Frequency )				
-					newvalue =  BestCompressedLength[innerscan]  + CompressedSizeFromInnerScanToOuterScan  
-					if verboseflag: print >>outfile,  " %7.3f bits" % (newvalue), 
-					if  MinimumCompressedSize == 0.0 or MinimumCompressedSize > newvalue:
-						MinimumCompressedSize = newvalue
-						LastChunk = Piece
-						LastChunkStartingPoint = innerscan
-						if verboseflag: print >>outfile,  " %7.3f bits" % (MinimumCompressedSize), 
-				else:
-					if verboseflag: print >>outfile,"   %5s" % "No. ",
-			BestCompressedLength[outerscan] = MinimumCompressedSize
-			if LastChunkStartingPoint > 0:
-				Parse[outerscan] = list(Parse[LastChunkStartingPoint])
-			else:
-				Parse[outerscan] = list()
-			if verboseflag: print >>outfile, "\n\t\t\t\t\t\t\t\tchosen:", LastChunk,
-			Parse[outerscan].append(LastChunk)
-
-			#if len(LastChunk) == 0:
-			#	print >>outfile, "line 212", word, Parse[outerscan]		 
-			#	print "line 212", word, "outerscan:", outerscan, "Last chunk:", LastChunk, Parse[outerscan]		
+		# We move the starting point (innerscan) from left to right, and the trie gives us
+		# each lexicon entry that begins there. Each one is a candidate for the last chunk
+		# of the prefix that ends at outerscan. By the time innerscan reaches a position,
+		# every chunk that could end there has been seen, so its best parse is settled.
+		# We only keep a backpointer (LastChunkStartingPoint) for each position, and read
+		# the parse off the backpointers once, at the end.
+		root = self.m_Trie.m_Root
+		plog = self.PieceCosts()
+		probes = 0
+		matches = 0
+		for innerscan in range(wordlength):
+			if verboseflag and innerscan > 0: print ("\n\t\t\t\t\t\t\t\tchosen:", LastChunk[innerscan], file = outfile)
+			node = root
+			for outerscan in range(innerscan + 1, wordlength + 1):
+				node = node.get(word[outerscan - 1])
+				if node is None:
+					break
+				if TrieKeyMarker not in node:
+					continue
+				matches += 1
+				Piece = node[TrieKeyMarker]
+				CompressedSizeFromInnerScanToOuterScan = plog[Piece]
+				newvalue =  BestCompressedLength[innerscan]  + CompressedSizeFromInnerScanToOuterScan
+				if verboseflag: print (" %3s\t%3s   %5s %7.3f bits" % (outerscan, innerscan, Piece, newvalue), file = outfile)
+				# ties go to the earlier starting point, i.e. the longer chunk
+				if BestCompressedLength[outerscan] > newvalue:
+					BestCompressedLength[outerscan] = newvalue
+					LastChunk[outerscan] = Piece
+					LastChunkStartingPoint[outerscan] = innerscan
+			# whether the walk broke off or ran to the end of the word, it looked up a node
+			# for each letter up to outerscan
+			probes += outerscan - innerscan
+		if work is not None:
+			work[0] += 1
+			work[1] += probes
+			work[2] += matches
+		Parse = list()
+		position = wordlength
+		while position > 0:
+			Parse.append(LastChunk[position])
+			position = LastChunkStartingPoint[position]
+		Parse.reverse()
 
 		if verboseflag: 
-			PrintList(Parse[wordlength], outfile)
-		bitcost = BestCompressedLength[outerscan]
-		return (Parse[wordlength],bitcost)
+			PrintList(Parse, outfile)
+		bitcost = BestCompressedLength[wordlength]
+		return (Parse,bitcost)
 # ---------------------------------------------------------#
+	# The bigram counts, and the buckets of m_BigramsByCount, are kept up to date by SetParsedLine
+	# as lines are reparsed, so all that is left here is to pick the most frequent ones that are
+	# not entries and were never deleted.
+	# Among nominees with the same count, the one that occurs first in the corpus comes first,
+	# as it did when we counted by scanning the corpus; which of them make the cut matters for
+	# the rest of the run.
+	@MeasuredStage
 	def GenerateCandidates(self, howmany, outfile):
-		Nominees = dict()
 		NomineeList = list()
-		for parsed_line in self.m_ParsedCorpus:	 
-			for wordno in range(len(parsed_line)-1):
-				candidate = parsed_line[wordno] + parsed_line[wordno + 1]				 		 
-				if candidate in self.m_EntryDict:					 
-					continue										 
-				if candidate in Nominees:
-					Nominees[candidate] += 1
-				else:
-					Nominees[candidate] = 1					 
-		EntireNomineeList = sorted(Nominees.items(),key=operator.itemgetter(1),reverse=True)
-		for nominee, count in EntireNomineeList:
-			if nominee  in self.m_DeletionDict:				 
-				continue
-			else:				 
-				NomineeList.append((nominee,count))
-			if len(NomineeList) == howmany:
-				break
+		if self.m_CandidateScoring == "mdl":
+			# the gain of a nominee is not in step with its count, so they all have to be scored
+			NomineeList = self.RankByDescriptionLength(self.EligibleNominees(), howmany)
+		# While the lexicon is only letters, each held at a count of 1, the first entries raise the
+		# cost of every letter by more than they save, and no nominee is expected to gain; then we
+		# take the most frequent ones, as count scoring does.
+		by_count = len(NomineeList) == 0
+		if by_count:
+			Nominees = self.EligibleNominees(howmany)
+			NomineeList = heapq.nlargest(howmany, Nominees, key=operator.itemgetter(1))
+		if len(NomineeList) > 0 and by_count:
+			numberofnominees = len(NomineeList)
+			cutoff = NomineeList[-1][1]
+			NomineeList = [(nominee, count) for nominee, count in NomineeList if count > cutoff]
+			# there can be thousands tied at the cutoff, so first narrow them down by the line they first occur on
+			Tied = sorted((min(self.m_BigramLines[nominee]), nominee, count) for nominee, count in Nominees if count == cutoff)
+			last_line = Tied[numberofnominees - len(NomineeList) - 1][0]
+			NomineeList += [(nominee, count) for line_number, nominee, count in Tied if line_number <= last_line]
+			NomineeList.sort(key = lambda item: (-item[1], self.FirstOccurrence(item[0])))
+			del NomineeList[numberofnominees:]
 		#print "Nominees:"
 		latex_data= list()
 		latex_data.append("piece   count   status")
 		for nominee, count in NomineeList:
 			self.AddEntry(nominee,count)
+			self.m_LastCandidates.add(nominee)
 			print ("%20s   %8i" %(nominee, count))
 			latex_data.append(nominee +  "\t" + "{:,}".format(count) )
-		MakeLatexTable(latex_data,outfile)
+		# imported here, so that the lexicon can be loaded without the reporting code; the table is
+		# left out when there is no report to put it in, or latexTable is not installed
+		if outfile is not None:
+			try:
+				from latexTable import MakeLatexTable
+			except ImportError:
+				MakeLatexTable = None
+			if MakeLatexTable is not None:
+				MakeLatexTable(latex_data,outfile)
 		self.ComputeDictFrequencies()
 		return NomineeList
 
 # ---------------------------------------------------------#
+	# The howmany nominees that DescriptionLengthGain expects to shorten the description length the
+	# most, best first, as (nominee, count); nominees it expects to lengthen it are left out.
+	def RankByDescriptionLength(self, Nominees, howmany):
+		total_usage = self.m_NumberOfHypothesizedRunningWords
+		total_count = 0
+		for entry in self.m_EntryDict.values():
+			total_count += entry.m_Count
+		Scored = list()
+		for nominee, count in Nominees:
+			gain = self.DescriptionLengthGain(nominee, count, total_usage, total_count)
+			if gain > 0:
+				Scored.append((nominee, count, gain))
+		Scored = heapq.nsmallest(howmany, Scored, key = lambda item: (-item[2], item[0]))
+		return [(nominee, count) for nominee, count, gain in Scored]
+	# What the corpus cost plus the dictionary length would go down by if nominee were an entry and
+	# each of its count occurrences as two pieces of a parse became one piece. Which two pieces
+	# they were is not kept, so we take them to be the cheapest way to split nominee into two entries.
+	# The corpus is priced as ParseCorpus prices it: a piece used n times (m_ParseCounts) costs
+	# n * -log(m_Count / total of m_Count), where m_Count follows the parse, except that
+	# FilterZeroCountEntries keeps every single letter at 1. That is
+	#	total usage * log(total count) - sum over pieces of n * log(m_Count),
+	# and only the nominee and the two pieces of its split change their n and m_Count. The dictionary
+	# gains the letters of the nominee, and loses those of a piece that is left with no uses.
+	def DescriptionLengthGain(self, nominee, count, total_usage, total_count):
+		plog = self.m_EntryPlog
+		best_cost = math.inf
+		for split in range(1, len(nominee)):
+			left, right = nominee[:split], nominee[split:]
+			if left in plog and right in plog and plog[left] + plog[right] < best_cost:
+				best_cost = plog[left] + plog[right]
+				best_split = (left, right)
+		if math.isinf(best_cost):
+			return -math.inf
+		usage_changes = {nominee: count}
+		for piece in best_split:
+			usage_changes[piece] = usage_changes.get(piece, 0) - count
+		new_total_count = total_count
+		usage_term_change = 0.0
+		dictionary_change = 0.0
+		for letter in nominee:
+			dictionary_change += self.m_LetterPlog[letter]
+		for piece, change in usage_changes.items():
+			usage = self.m_ParseCounts.get(piece, 0)
+			new_usage = max(usage + change, 0)
+			entry_count = self.m_EntryDict[piece].m_Count if piece in self.m_EntryDict else 0
+			if len(piece) == 1:
+				new_entry_count = entry_count
+			else:
+				new_entry_count = max(entry_count + change, 0)
+			new_total_count += new_entry_count - entry_count
+			usage_term_change += LogTimes(new_usage, new_entry_count) - LogTimes(usage, entry_count)
+			# a piece that the nominee takes every use of is deleted by FilterZeroCountEntries
+			if new_entry_count == 0 and entry_count > 0:
+				for letter in piece:
+					dictionary_change -= self.m_LetterPlog[letter]
+		corpus_change = (total_usage - count) * math.log(new_total_count) - total_usage * math.log(total_count) - usage_term_change
+		return -1 * (corpus_change + dictionary_change)
+# ---------------------------------------------------------#
+	# Soft counts: each entry gets, from every line, the expected number of times it occurs in
+	# a parse of that line, with parses weighted by their probability under the current
+	# frequencies. These replace the Viterbi counts when m_TrainingMode is "em".
 	def Expectation(self):
-		self.m_NumberOfHypothesizedRunningWords = 0
+		self.m_NumberOfSoftRunningWords = 0.0
+		SoftCounts = dict()
+		plog = self.PieceCosts()
 		for this_line in self.m_Corpus:
 			wordlength = len(this_line)
-			ForwardProb = dict()
-			BackwardProb = dict()
-			Forward(this_line,ForwardProb)
-			Backward(this_line,BackwardProb)
-			this_word_prob = BackwardProb[0]
-			
-			if WordProb > 0:
-				for nPos in range(wordlength):
-					for End in range(nPos, wordlength-1):
-						if End- nPos + 1 > self.m_SizeOfLongestEntry:
-							continue
-						if nPos == 0 and End == wordlength - 1:
-							continue
-						Piece = this_line[nPos, End+1]
-						if Piece in self.m_EntryDict:
-							this_entry = self.m_EntryDict[Piece]
-							CurrentIncrement = ((ForwardProb[nPos] * BackwardProb[End+1])* this_entry.m_Frequency ) / WordProb
-							this_entry.m_Count += CurrentIncrement
-							self.m_NumberOfHypothesizedRunningWords += CurrentIncrement			
-
-
+			Lattice = self.MatchLattice(this_line)
+			ForwardProb = self.Forward(this_line, Lattice)
+			BackwardProb = self.Backward(this_line, Lattice)
+			LineProb = BackwardProb[0]
+			if LineProb == -math.inf:
+				continue
+			for nPos in range(wordlength):
+				if ForwardProb[nPos] == -math.inf:
+					continue
+				for End, Piece in Lattice[nPos]:
+					if nPos == 0 and End == wordlength:
+						continue  # a line does not count as a word of itself
+					CurrentIncrement = math.exp(ForwardProb[nPos] - plog[Piece] + BackwardProb[End] - LineProb)
+					if Piece in SoftCounts:
+						SoftCounts[Piece] += CurrentIncrement
+					else:
+						SoftCounts[Piece] = CurrentIncrement
+					self.m_NumberOfSoftRunningWords += CurrentIncrement
+		for this_entry in self.m_EntryDict.values():
+			this_entry.m_Count = 0
+		for Piece, count in SoftCounts.items():
+			self.m_EntryDict[self.ParsedLineKeys([Piece])[0]].m_Count = count
+		self.m_ChangedCounts.update(self.m_EntryDict)
+		self.m_ChangedMetricWords.update(self.m_EntryDict)
 
 # ---------------------------------------------------------#
 	def Maximization(self):
-		for entry in self.m_EntryDict:
-			entry.m_Frequency = entry.m_Count / self.m_NumberOfHypothesizedRunningWords
+		TotalCount = 0.0
+		for entry in self.m_EntryDict.values():
+			TotalCount += entry.m_Count
+		for entry in self.m_EntryDict.values():
+			entry.m_Frequency = entry.m_Count / TotalCount
+		self.ComputeEntryPlogs()
 
 # ---------------------------------------------------------#
-	def Forward (self, this_line,ForwardProb):
-		ForwardProb[0]=1.0
-		for Pos in range(1,Length+1):
-			ForwardProb[Pos] = 0.0
-			if (Pos - i > self.m_SizeOfLongestEntry):
-				break
-			Piece = this_line[i,Pos+1]
-			if Piece in self.m_EntryDict:
-				this_Entry = self.m_EntryDict[Piece]
-				vlProduct = ForwardProb[i] * this_Entry.m_Frequency
-				ForwardProb[Pos] = ForwardProb[Pos] + vlProduct
+	# For each position in this_line, the (end position, key) of every entry that starts there.
+	# Forward and Backward both walk this instead of looking pieces up again.
+	def MatchLattice(self, this_line):
+		return [list(self.m_Trie.Matches(this_line, start)) for start in range(len(this_line))]
+
+# ---------------------------------------------------------#
+	# ForwardProb[Pos] is the log of the total probability of all the parses of this_line[:Pos].
+	# We stay in log space so that long lines do not underflow.
+	def Forward (self, this_line, Lattice):
+		Length = len(this_line)
+		ForwardProb = [-math.inf] * (Length + 1)
+		ForwardProb[0] = 0.0
+		plog = self.PieceCosts()
+		for i in range(Length):
+			if ForwardProb[i] == -math.inf:
+				continue
+			for Pos, Piece in Lattice[i]:
+				vlProduct = ForwardProb[i] - plog[Piece]
+				ForwardProb[Pos] = LogAdd(ForwardProb[Pos], vlProduct)
 		return ForwardProb
 
 # ---------------------------------------------------------#
-	def Backward(self, this_line,BackwardProb):
-		
+	# BackwardProb[Pos] is the log of the total probability of all the parses of this_line[Pos:].
+	def Backward(self, this_line, Lattice):
 		Last = len(this_line) -1
-		BackwardProb[Last+1] = 1.0
-		for Pos in range( Last, Pos >= 0,-1):
-			BackwardProb[Pos] = 0
-			for i in range(Pos, i <= Last,-1):
-				if i-Pos +1 > m_SizeOfLongestEntry:
-					Piece = this_line[Pos, i+1]
-					if Piece in self.m_EntryDict[Piece]:
-						this_Entry = self.m_EntryDict[Piece]
-						if this_Entry.m_Frequency == 0.0:
-							continue
-						vlProduct = BackwardProb[i+1] * this_Entry.m_Frequency
-						BackwardProb[Pos] += vlProduct
+		BackwardProb = [-math.inf] * (Last + 2)
+		BackwardProb[Last+1] = 0.0
+		plog = self.PieceCosts()
+		for Pos in range(Last, -1, -1):
+			for End, Piece in Lattice[Pos]:
+				vlProduct = BackwardProb[End] - plog[Piece]
+				BackwardProb[Pos] = LogAdd(BackwardProb[Pos], vlProduct)
 		return BackwardProb
 
 
+# ---------------------------------------------------------#
+	# Everything Resume needs to carry on after RecallPrecision of current_iteration, as plain
+	# lists and dicts for write_checkpoint. The corpus, the true breaks and the glossary are not
+	# here: ReadBrokenCorpus reads them again. Parses are stored as lists of entry IDs.
+	def Checkpoint(self, current_iteration):
+		ids = dict()
+		for id, key in enumerate(self.m_EntryKeys):
+			ids[key] = id
+		state = dict()
+		state["iteration"] = current_iteration
+		state["entries"] = [(key, entry.m_Count, entry.m_Frequency, list(entry.m_CountRegister)) for key, entry in self.m_EntryDict.items()]
+		state["entry_keys"] = self.m_EntryKeys
+		state["letters"] = self.m_LetterDict
+		state["letter_plogs"] = self.m_LetterPlog
+		state["size_of_longest_entry"] = self.m_SizeOfLongestEntry
+		state["corpus_cost"] = self.m_CorpusCost
+		state["dictionary_length"] = self.m_DictionaryLength
+		state["parsed_corpus"] = [[ids[key] for key in self.ParsedLineKeys(parsed_line)] for parsed_line in self.m_ParsedCorpus]
+		state["parse_count_order"] = list(self.m_ParseCounts)
+		state["new_entries"] = self.m_NewEntries
+		state["changed_counts"] = sorted(self.m_ChangedCounts)
+		state["changed_metric_words"] = sorted(self.m_ChangedMetricWords)
+		state["word_true_positives"] = self.m_WordTruePositives
+		state["token_true_positives"] = self.m_TokenTruePositives
+		state["type_true_positives"] = self.m_TypeTruePositives
+		state["soft_running_words"] = self.m_NumberOfSoftRunningWords
+		state["deletion_list"] = self.m_DeletionList
+		state["candidate_history"] = self.m_CandidateHistory
+		state["reparsed_lines_history"] = self.m_ReparsedLinesHistory
+		state["break_based_history"] = self.m_Break_based_RecallPrecisionHistory
+		state["token_based_history"] = self.m_Token_based_RecallPrecisionHistory
+		state["type_based_history"] = self.m_Type_based_RecallPrecisionHistory
+		state["dictionary_length_history"] = self.m_DictionaryLengthHistory
+		state["corpus_cost_history"] = self.m_CorpusCostHistory
+		return state
+	# Call after ReadBrokenCorpus, with what Checkpoint returned.
+	def Resume(self, state):
+		self.m_EntryKeys = state["entry_keys"]
+		self.m_EntryDict = dict()
+		self.m_EntryIds = dict()
+		self.m_Trie = LexiconTrie()
+		for key, count, frequency, count_register in state["entries"]:
+			entry = LexiconEntry(key, count)
+			entry.m_Frequency = frequency
+			entry.m_CountRegister = array('d', count_register)
+			self.m_EntryDict[key] = entry
+		for id, key in enumerate(self.m_EntryKeys):
+			if key in self.m_EntryDict:
+				self.m_EntryIds[key] = id
+				if self.m_CompactCorpus:
+					self.m_Trie.Insert(self.m_Corpus.Encode(key), id)
+				else:
+					self.m_Trie.Insert(key, key)
+		self.ComputeEntryPlogs()
+		self.m_LetterDict = state["letters"]
+		self.m_LetterPlog = state["letter_plogs"]
+		self.m_SizeOfLongestEntry = state["size_of_longest_entry"]
+		self.m_CorpusCost = state["corpus_cost"]
+		self.m_DictionaryLength = state["dictionary_length"]
+		self.m_ParsedCorpus = [list() for line_number in range(len(self.m_Corpus))]
+		self.m_ParseCounts = dict()
+		self.m_BigramCounts = dict()
+		self.m_BigramLines = dict()
+		self.m_BigramsByCount = dict()
+		self.m_NumberOfHypothesizedRunningWords = 0
+		for line_number, parsed_line in enumerate(state["parsed_corpus"]):
+			if self.m_CompactCorpus:
+				parsed_line = array('I', parsed_line)
+			else:
+				parsed_line = [self.m_EntryKeys[id] for id in parsed_line]
+			self.SetParsedLine(line_number, parsed_line)
+		# the order of m_ParseCounts is the order ParseCorpus adds up the corpus cost in
+		self.m_ParseCounts = {key: self.m_ParseCounts[key] for key in state["parse_count_order"]}
+		self.m_NewEntries = state["new_entries"]
+		self.m_ChangedCounts = set(state["changed_counts"])
+		self.m_ChangedTallies = set()
+		self.m_ChangedMetricWords = set(state["changed_metric_words"])
+		self.m_WordTruePositives = state["word_true_positives"]
+		self.m_TokenTruePositives = state["token_true_positives"]
+		self.m_TypeTruePositives = state["type_true_positives"]
+		self.m_NumberOfSoftRunningWords = state["soft_running_words"]
+		self.m_DeletionList = [tuple(item) for item in state["deletion_list"]]
+		self.m_DeletionDict = dict()
+		for key, iteration_number in self.m_DeletionList:
+			self.m_DeletionDict[key] = 1
+		self.m_CandidateHistory = [tuple(item) for item in state.get("candidate_history", [])]
+		self.m_ReparsedLinesHistory = [tuple(item) for item in state["reparsed_lines_history"]]
+		self.m_Break_based_RecallPrecisionHistory = [tuple(item) for item in state["break_based_history"]]
+		self.m_Token_based_RecallPrecisionHistory = [tuple(item) for item in state["token_based_history"]]
+		self.m_Type_based_RecallPrecisionHistory = [tuple(item) for item in state["type_based_history"]]
+		self.m_DictionaryLengthHistory = state["dictionary_length_history"]
+		self.m_CorpusCostHistory = state["corpus_cost_history"]
 # ---------------------------------------------------------#		
 	def PrintLexicon(self, outfile):
 		for key in sorted(self.m_EntryDict.keys()):			 
@@ -433,94 +1137,23 @@ class Lexicon:
  
 
 # ---------------------------------------------------------#
+	@MeasuredStage
 	def RecallPrecision(self, iteration_number, outfile,total_word_count_in_parse):
 		 
 		total_true_positive_for_break = 0
 		total_number_of_hypothesized_words = 0
 		total_number_of_true_words = 0
 		for linenumber in range(len(self.m_TrueBreakPointList)):		 
-			truth = list(self.m_TrueBreakPointList[linenumber])			 
+			truth = self.m_TrueBreakPointList[linenumber]			 
 			if len(truth) < 2:
-				print >>outfile, "Skipping this line:", self.m_Corpus[linenumber]
+				print ("Skipping this line:", self.CorpusLine(linenumber), file = outfile)
 				continue
 			number_of_true_words = len(truth) -1				
-			hypothesis = list()  					 
-			hypothesis_line_length = 0
-			accurate_word_discovery = 0
-			true_positive_for_break = 0
-			word_too_big = 0
-			word_too_small = 0
-			real_word_lag = 0
-			hypothesis_word_lag = 0
-			 
-			for piece in self.m_ParsedCorpus[linenumber]:
-				hypothesis_line_length += len(piece)
-				hypothesis.append(hypothesis_line_length)
+			# the hypothesis breakpoints are the ends of its pieces; the breaks it gets right
+			# are just the ones it has in common with the truth
+			hypothesis = set(accumulate(self.ChunkLengths(self.m_ParsedCorpus[linenumber])))
 			number_of_hypothesized_words = len(hypothesis) 			 
-
-			# state 0: at the last test, the two parses were in agreement
-			# state 1: at the last test, truth was # and hypothesis was not
-			# state 2: at the last test, hypothesis was # and truth was not
-			pointer = 0
-			state = 0
-			while (len(truth) > 0 and len(hypothesis) > 0):
-				 
-				next_truth = truth[0]
-				next_hypothesis  = hypothesis[0]
-				if state == 0:
-					real_word_lag = 0
-					hypothesis_word_lag = 0					
-									
-					if next_truth == next_hypothesis:
-						pointer = truth.pop(0)
-						hypothesis.pop(0)
-						true_positive_for_break += 1
-						accurate_word_discovery += 1
-						state = 0
-					elif next_truth < next_hypothesis:						 
-						pointer = truth.pop(0)
-						real_word_lag += 1
-						state = 1
-					else: #next_hypothesis < next_truth:						 
-						pointer = hypothesis.pop(0)
-						hypothesis_word_lag = 1
-						state = 2
-				elif state == 1:
-					if next_truth == next_hypothesis:
-						pointer = truth.pop(0)
-						hypothesis.pop(0)
-						true_positive_for_break += 1
-						word_too_big += 1						
-						state = 0
-					elif next_truth < next_hypothesis:
-						pointer = truth.pop(0)
-						real_word_lag += 1
-						state = 1 #redundantly
-					else: 
-						pointer = hypothesis.pop(0)
-						hypothesis_word_lag += 1
-						state = 2
-				else: #state = 2
-					if next_truth == next_hypothesis:
-						pointer = truth.pop(0)
-						hypothesis.pop(0)
-						true_positive_for_break += 1
-						word_too_small +=1
-						state = 0
-					elif next_truth < next_hypothesis:
-						pointer = truth.pop(0)
-						real_word_lag += 1
-						state = 1
-					else:
-						pointer = hypothesis.pop(0)
-						hypothesis_word_lag += 1
-						state =2 						
-			 			 
- 
-	
-					
-			precision = float(true_positive_for_break) /  number_of_hypothesized_words 
-			recall    = float(true_positive_for_break) /  number_of_true_words 			
+			true_positive_for_break = len(hypothesis.intersection(truth))
 			 		
 			total_true_positive_for_break += true_positive_for_break
 			total_number_of_hypothesized_words += number_of_hypothesized_words
@@ -545,15 +1178,11 @@ class Lexicon:
 		
 
 
+		self.UpdateWordMetrics()
+		if self.m_CheckWordMetrics:
+			self.CheckWordMetrics()
 		if (True):
-			true_positives = 0
-			for (word, this_words_entry) in self.m_EntryDict.items():
-				if word in self.m_TrueDictionary:
-					true_count = self.m_TrueDictionary[word]
-					these_true_positives = min(true_count, this_words_entry.m_Count)
-				else:
-					these_true_positives = 0
-				true_positives += these_true_positives
+			true_positives = self.m_TokenTruePositives
 			word_recall = float(true_positives) / self.m_NumberOfTrueRunningWords
 			word_precision = float(true_positives) / self.m_NumberOfHypothesizedRunningWords
 			self.m_Token_based_RecallPrecisionHistory.append((iteration_number,  word_precision,word_recall))
@@ -564,10 +1193,7 @@ class Lexicon:
 
 		# Type_based precision for word discovery:
 		if (True):
-			true_positives = 0
-			for (word, this_words_entry) in self.m_EntryDict.items():
-				if word in self.m_TrueDictionary:
-					true_positives +=1
+			true_positives = self.m_TypeTruePositives
 			word_recall = float(true_positives) / len(self.m_TrueDictionary)
 			word_precision = float(true_positives) / len(self.m_EntryDict)
 			self.m_Type_based_RecallPrecisionHistory.append((iteration_number,  word_precision,word_recall))
@@ -577,11 +1203,47 @@ class Lexicon:
 			print  (formatstring %( "Type_based Word Precision", word_precision, "recall", word_recall), file=outfile)
 			print  (formatstring %( "Type_based Word Precision", word_precision, "recall", word_recall))
 
+# ---------------------------------------------------------#
+	# The token- and type-based true positives are kept as running totals. Only the entries
+	# in m_ChangedMetricWords can have moved since the last call, so only they are looked at.
+	def UpdateWordMetrics(self):
+		if len(self.m_ChangedMetricWords) * 2 > len(self.m_EntryDict):
+			# most of the lexicon moved (in "em" mode, all of it): count again, in lexicon order,
+			# so that sums of soft counts come out the same from one run to the next
+			self.m_WordTruePositives = dict()
+			self.m_TokenTruePositives = 0
+			self.m_TypeTruePositives = 0
+			changed_words = list(self.m_EntryDict)
+		else:
+			changed_words = sorted(self.m_ChangedMetricWords)
+		for word in changed_words:
+			if word not in self.m_TrueDictionary:
+				continue
+			if word in self.m_WordTruePositives:
+				self.m_TokenTruePositives -= self.m_WordTruePositives.pop(word)
+				self.m_TypeTruePositives -= 1
+			if word in self.m_EntryDict:
+				these_true_positives = min(self.m_TrueDictionary[word], self.m_EntryDict[word].m_Count)
+				self.m_WordTruePositives[word] = these_true_positives
+				self.m_TokenTruePositives += these_true_positives
+				self.m_TypeTruePositives += 1
+		self.m_ChangedMetricWords = set()
+	# For debugging: recomputes the running totals over the whole lexicon.
+	def CheckWordMetrics(self):
+		token_true_positives = 0
+		type_true_positives = 0
+		for (word, this_words_entry) in self.m_EntryDict.items():
+			if word in self.m_TrueDictionary:
+				token_true_positives += min(self.m_TrueDictionary[word], this_words_entry.m_Count)
+				type_true_positives += 1
+		if not math.isclose(token_true_positives, self.m_TokenTruePositives) or type_true_positives != self.m_TypeTruePositives:
+			print ("Warning: word metrics are off. Token true positives", self.m_TokenTruePositives, "should be", token_true_positives,
+				"; type true positives", self.m_TypeTruePositives, "should be", type_true_positives)
 # ---------------------------------------------------------#
 	def PrintRecallPrecision(self,outfile):	
 		print  ("\t\t\tBreak\t\tToken-based\t\tType-based", file = outfile)
 		print  ("\t\t\tprecision\trecall\tprecision\trecall\tprecision\trecall", file=outfile)
-		for iterno in (range(numberofcycles-1)):
+		for iterno in range(len(self.m_Break_based_RecallPrecisionHistory)):
 			print ("printing iterno", iterno)
 			(iteration, p1,r1) = self.m_Break_based_RecallPrecisionHistory[iterno]
 			(iteration, p2,r2) = self.m_Token_based_RecallPrecisionHistory[iterno]
@@ -594,9 +1256,9 @@ class Lexicon:
 	def  analyze_history(self,infileparsings, target_word):
 		good_lines = dict()
 		#line_locations = list()
-		if  target_word not in self.m_Glossary:
+		if  target_word not in self.m_TrueDictionary:
 			print ("Target word not found in corpus.")
-		for lineno, startposition in self.m_Glossary[target_word]:
+		for lineno, startposition in self.GlossaryLocations(target_word):
 			if lineno not in good_lines:
 				good_lines[lineno] = list()
 			good_lines[lineno].append(startposition)
@@ -626,8 +1288,7 @@ class Lexicon:
 			#print()
 			if (line_number in good_lines):				 
 				#print (607, breakpoints)
-				for startpoint in good_lines[line_number]:
-					multiword = self.analyze(line_number, target_word, startpoint, breakpoints)
+				for multiword in self.analyze_line(line_number, target_word, good_lines[line_number], breakpoints):
 					print (609, target_word, multiword)
 
 			line_number += 1
@@ -636,7 +1297,7 @@ class Lexicon:
 	# ---------------------------------------------------------#
 	# returns a string
 	def corpus_slice(self, line_number, start_position, length):
-		return self.m_Corpus[line_number][start_position:start_position + length]
+		return self.CorpusLine(line_number)[start_position:start_position + length]
 	# ---------------------------------------------------------#
 	def corpus_slice_from_piece_number(self, line_number, breakpoint_list, piece_number):
 		start_position = breakpoint_list[piece_number]
@@ -656,21 +1317,14 @@ class Lexicon:
  	# ---------------------------------------------------------#
  	# Given a position in a string, return the piece number of the breakpoint list that it is in
 	def position2chunk_number (self,  breakpoint_list, position):
-		pointing_to = 0
-		for n in  range(len(breakpoint_list)):
-			if breakpoint_list[n] == position:
-				#print (648, "position ", position, "found in chunk number ", n)
-				return n;
-			if breakpoint_list[n] > position:
-				return n-1
-		return -1	
+		return chunk_number(breakpoint_list, position)
  	# ---------------------------------------------------------#
 	def piece_number2slice(self, line_number, breakpoints, chunk_number):
 		#print (652, "chunk number", chunk_number)
 		start_position = breakpoints[chunk_number]
 		end = breakpoints[chunk_number+1]
 		#print (657, "chunk ", self.m_Corpus[line_number][start_position:end])
-		return self.m_Corpus[line_number][start_position:end]
+		return self.CorpusLine(line_number)[start_position:end]
 
  	# ---------------------------------------------------------#
  	# This does not need to be part of the Class.
@@ -691,7 +1345,6 @@ class Lexicon:
 		for n in range(first_piece_number, last_piece_number +1):
 			if len(resulting_slice) != 0:
 				resulting_slice += " "
-			chunk_number = 	self.position2chunk_number( breakpoint_list, n )
 			chunk = self.corpus_slice_from_piece_number(line_number, breakpoint_list, n  )
 			resulting_slice += chunk
 		return resulting_slice	
@@ -700,40 +1353,12 @@ class Lexicon:
 	# which shows how that True Parse is analyzed in the parse
 	# provided by "breakpoints".
 	def analyze(self, line_number, target_word, startpoint, breakpoints):
-		start_chunk_number = self.position2chunk_number(breakpoints, startpoint) 
-		endpoint = startpoint + len(target_word) - 1
-		end_chunk_number = self.position2chunk_number( breakpoints,endpoint)
-		end_chunk = self.piece_number2slice(line_number, breakpoints, end_chunk_number)
-		return self.corpus_slice_sequence(line_number, breakpoints, start_chunk_number, end_chunk_number)
-
-
-		if(False):
-				for n in range(len(pieces)):
-					if pointing_to == startpoint:
-						output = self.corpus_slice(line_number, startpoint,  pieces[n])
-						print ("step 1a ", pieces[n])
-						break 
-					if pointing_to > startpoint:
-						output = self.corpus_slice(line_number, startpoint,  pieces[n-1])
-						print ("step 1b ", pieces[n]) 
-						break;
-					if n == len(pieces) - 1:
-						output = self.corpus_slice(line_number, startpoint,  pieces[n])
-						print ("step 1c ", pieces[n])
-						break
-					if pointing_to + pieces[n+1] > startpoint:
-						output = self.corpus_slice(line_number, startpoint,  pieces[n])
-						print ("step 1d ", pieces[n+1]) 
-						#pointing_to  += len(pieces[n])
-						break;
-				pointing_to += pieces[n]
-				n += 1		
-				print ("Step 2" , output, "start point", startpoint, "n", n, "endpoint ", endpoint)
-				while pointing_to < endpoint:
-					output += " " + self.corpus_slice(line_number, pointing_to,  pieces[n])
-					print ("2 " + output, )
-					pointing_to += pieces[n]
-		return output
+		return self.analyze_line(line_number, target_word, [startpoint], breakpoints)[0]
+	# the same, for all the start points of target_word in a line at once
+	def analyze_line(self, line_number, target_word, startpoints, breakpoints):
+		spans = chunk_spans(breakpoints, [(startpoint, len(target_word)) for startpoint in startpoints])
+		return [self.corpus_slice_sequence(line_number, breakpoints, start_chunk_number, end_chunk_number)
+			for start_chunk_number, end_chunk_number in spans]
 # ---------------------------------------------------------#
 #-----------------------------------------#
 	def read_parses_from_files_and_analyze_word(target):
@@ -743,6 +1368,62 @@ class Lexicon:
 
 
 
+# ---------------------------------------------------------#
+# Which chunk of a parse a position is in: n if the position is breakpoint_list[n], or the
+# breakpoint before it; -1 if it is past the last breakpoint.
+def chunk_number(breakpoint_list, position):
+	n = bisect.bisect_right(breakpoint_list, position) - 1
+	if n == len(breakpoint_list) - 1 and (n < 0 or breakpoint_list[n] != position):
+		return -1
+	return n
+
+# For each (start position, length) in spans, the numbers of the first and the last chunks
+# of the parse that the span of letters falls in, as chunk_number gives them. The ends of the
+# spans are taken in order of position, so one walk along the breakpoints serves them all.
+def chunk_spans(breakpoint_list, spans):
+	ends = list()
+	for n, (start_position, length) in enumerate(spans):
+		ends.append((start_position, 2 * n))
+		ends.append((start_position + length - 1, 2 * n + 1))
+	ends.sort()
+	chunks = [-1] * len(ends)
+	last = len(breakpoint_list) - 1
+	k = 0
+	for position, slot in ends:
+		while k < last and breakpoint_list[k + 1] <= position:
+			k += 1
+		if last < 0 or position < breakpoint_list[k] or (k == last and breakpoint_list[k] != position):
+			continue
+		chunks[slot] = k
+	return [(chunks[2 * n], chunks[2 * n + 1]) for n in range(len(spans))]
+
+#---------------------------------------------------------#
+
+# The lexicon that ParseCorpusInParallel's worker processes parse with; they inherit it when they are forked.
+g_worker_lexicon = None
+def ParseShard(line_numbers):
+	return g_worker_lexicon.ParseLines(line_numbers)
+
+#---------------------------------------------------------#
+
+# n * log(count), for n uses of a piece whose entry has that count; nothing if it is not used
+def LogTimes(n, count):
+	if n <= 0:
+		return 0.0
+	if count <= 0:
+		return -math.inf
+	return n * math.log(count)
+
+# log(exp(a) + exp(b)), without leaving log space
+def LogAdd(a, b):
+	if a < b:
+		a, b = b, a
+	if b == -math.inf:
+		return a
+	return a + math.log1p(math.exp(b - a))
+
+#---------------------------------------------------------#
+
 def PrintList(my_list, outfile):
 	print (file=outfile)
 	for item in my_list:
@@ -755,6 +1436,10 @@ def breakpoints2chunks(breakpoint_list):
 	for i in range(1, len(breakpoint_list)):
 		chunks.append(breakpoint_list[i]-breakpoint_list[i-1])
 	return chunks
+# the candidate entries a parse suggests: each pair of adjacent pieces, run together
+def Bigrams(parsed_line):
+	for wordno in range(len(parsed_line)-1):
+		yield parsed_line[wordno] + parsed_line[wordno + 1]
 def chunks2breakpoints(chunk_list):
 	breakpoint_list = list()
 	breakpoint_list.append(0)
@@ -765,13 +1450,33 @@ def chunks2breakpoints(chunk_list):
 	return breakpoint_list
 
 
+# Writes the checkpoint to a temporary file first, so that a crash while writing it
+# leaves the last one as it was.
+def write_checkpoint(filename, checkpoint):
+	temporary_filename = filename + ".tmp"
+	with open(temporary_filename, "w", encoding = 'utf-8') as outfile:
+		json.dump(checkpoint, outfile, separators = (',', ':'))
+		# on disk before it takes the place of the last one, or a crash could leave neither
+		outfile.flush()
+		os.fsync(outfile.fileno())
+	os.replace(temporary_filename, filename)
+
+def read_checkpoint(filename):
+	with open(filename, encoding = 'utf-8') as infile:
+		return json.load(infile)
+
+# Cuts a file back to its first size bytes, to go on writing it from there.
+def truncate_file(filename, size):
+	with open(filename, "r+b") as outfile:
+		outfile.truncate(size)
+
 # This is not a function in the class Lexicon
 def analyze_history_2(infile_parsings, target_word):
 		good_lines = dict()
 		#line_locations = list()
-		if  target_word not in self.m_Glossary:
+		if  target_word not in self.m_TrueDictionary:
 			print ("Target word not found in corpus.")
-		for lineno, startposition in self.m_Glossary[target_word]:
+		for lineno, startposition in self.GlossaryLocations(target_word):
 			if lineno not in good_lines:
 				good_lines[lineno] = list()
 			good_lines[lineno].append(startposition)
@@ -810,124 +1515,211 @@ def analyze_history_2(infile_parsings, target_word):
 
 
  
-total_word_count_in_parse 	= 0
-g_encoding 					= "utf8"  
-numberofcycles 				= 50
-howmanycandidatesperiteration = 100
-numberoflines 				=  51763
-		
-
-
-datadirectory 			= "../../data/english-browncorpus/"
-corpusfile 				= "browncorpus.txt"
-shortoutname 			= "wordbreaker_brown_corpus_"+ str(numberofcycles) + "_iters_" + str(howmanycandidatesperiteration) + "_new_per_iteration"
-
-#datadirectory 			= "../../data/russian/"
-#corpusfile 			= "russian.txt"
-#shortoutname 			= "wordbreaker-russian-" 
-
-
-
-#datadirectory 			= "../../data/french/"
-#corpusfile 			= "encarta_french_UTF8.txt"
-#shortoutname 			= "wordbreaker-encarta-" 
-
-#datadirectory 			= "../../data/spanish/"
-#corpusfile 			= "DonQuijoteutf8.txt"
-#shortoutname 			= "wordbreaker-donquijote-" 
-
-
-corpusfilename 			= datadirectory  + corpusfile
-outdirectory 			= datadirectory + "wordbreaking/"
-outfilename 			= outdirectory + shortoutname+  ".txt" 
-outfilename_processed_corpus 	= outdirectory + shortoutname + "_processed_corpus.txt"	
-outfilename_parsings			= outdirectory + shortoutname + "_iterated_parsings.txt"
+def main(argv = None):
+	argument_parser = argparse.ArgumentParser(description = "Learn a lexicon from a corpus with its spaces removed.")
+	argument_parser.add_argument("--data-directory", default = "../../data/english-browncorpus/", help = "directory the corpus is in; the output goes in its wordbreaking/ subdirectory")
+	argument_parser.add_argument("--corpus", default = "browncorpus.txt", help = "corpus file, in the data directory")
+	argument_parser.add_argument("--name", default = None, help = "prefix of the output files (default: from the corpus, the iterations and the candidates)")
+	argument_parser.add_argument("--iterations", type = int, default = 50, metavar = "N", help = "number of cycles")
+	argument_parser.add_argument("--candidates", type = int, default = 100, metavar = "N", help = "new candidates on each cycle")
+	argument_parser.add_argument("--lines", type = int, default = 51763, metavar = "N", help = "read at most N lines of the corpus (0: all)")
+	argument_parser.add_argument("--workers", type = int, default = 1, metavar = "N", help = "number of processes ParseCorpus parses the corpus with")
+	argument_parser.add_argument("--incremental", action = "store_true", help = "only reparse the lines that the new candidates could change")
+	argument_parser.add_argument("--resync", type = int, default = 0, metavar = "K", help = "with --incremental, reparse every line every K iterations")
+	argument_parser.add_argument("--training", choices = ["viterbi", "em"], default = "viterbi", help = "count entries in the best parse of each line (viterbi) or in all parses, weighted (em)")
+	argument_parser.add_argument("--scoring", choices = ["count", "mdl"], default = "count", help = "rank the candidates by how often they occur (count) or by how much they should shorten the description length (mdl)")
+	argument_parser.add_argument("--compact", action = "store_true", help = "keep the corpus as letter codes and the parses as entry IDs")
+	argument_parser.add_argument("--parsings-format", choices = ["text", "binary"], default = "text", help = "how to write the iterated parsings; see iterated_parsings.py")
+	argument_parser.add_argument("--snapshot-interval", type = int, default = None, metavar = "K", help = "with --parsings-format binary, write only the lines that changed, except every K iterations (0: only the first)")
+	argument_parser.add_argument("--checkpoint-interval", type = int, default = 0, metavar = "K", help = "save a checkpoint every K iterations, and after the last one")
+	argument_parser.add_argument("--resume", action = "store_true", help = "go on from the last checkpoint")
+	argument_parser.add_argument("--parse-cache-size", type = int, default = 100000, metavar = "N", help = "remember the parses of up to N distinct lines in each iteration (0: none)")
+	argument_parser.add_argument("--metrics", action = "store_true", help = "write the time each stage takes, on each iteration, to _metrics.jsonl")
+	argument_parser.add_argument("--metrics-memory", action = "store_true", help = "with --metrics, also trace the memory each stage allocates (slow)")
+	argument_parser.add_argument("--check-metrics", action = "store_true", help = "check the running word metrics against a full recount on every iteration")
+	arguments = argument_parser.parse_args(argv)
+	total_word_count_in_parse 	= 0
+	g_encoding 					= "utf8"  
+	numberofcycles 				= arguments.iterations
+	howmanycandidatesperiteration = arguments.candidates
+	numberoflines 				= arguments.lines
+	numberofworkers				= arguments.workers
+
+
+	datadirectory 			= arguments.data_directory
+	corpusfile 				= arguments.corpus
+	shortoutname 			= "wordbreaker_brown_corpus_"+ str(numberofcycles) + "_iters_" + str(howmanycandidatesperiteration) + "_new_per_iteration"
+	if arguments.name is not None:
+		shortoutname		= arguments.name
+
+	#datadirectory 			= "../../data/russian/"
+	#corpusfile 			= "russian.txt"
+	#shortoutname 			= "wordbreaker-russian-" 
+
+
+
+	#datadirectory 			= "../../data/french/"
+	#corpusfile 			= "encarta_french_UTF8.txt"
+	#shortoutname 			= "wordbreaker-encarta-" 
+
+	#datadirectory 			= "../../data/spanish/"
+	#corpusfile 			= "DonQuijoteutf8.txt"
+	#shortoutname 			= "wordbreaker-donquijote-" 
+
+
+	corpusfilename 			= datadirectory  + corpusfile
+	outdirectory 			= datadirectory + "wordbreaking/"
+	outfilename 			= outdirectory + shortoutname+  ".txt" 
+	outfilename_processed_corpus 	= outdirectory + shortoutname + "_processed_corpus.txt"	
+	outfilename_parsings			= outdirectory + shortoutname + "_iterated_parsings.txt"
+	if arguments.parsings_format == "binary":
+		outfilename_parsings		= outdirectory + shortoutname + "_iterated_parsings.bin"
 		
-outfile_corpus_name		    = outdirectory + shortoutname + "_final_broken_corpus.txt"
-outfile_lexicon_name	    = outdirectory + shortoutname + "_lexicon.txt"
-outfile_simple_lexicon_name	= outdirectory + shortoutname + "_simple_lexicon.txt"
-outfile_RecallPrecision_name= outdirectory + shortoutname + "_RecallPrecision.tsv"
-glossary_name				= outdirectory + shortoutname + "_glossary.txt";
-
-if g_encoding == "utf8":
-	outfile = codecs.open(outfilename, "w", encoding = 'utf-8')
-	outfile_processed_corpus = codecs.open(outfilename_processed_corpus, "w", encoding = 'utf-8')
-	outfile_parsings = codecs.open(outfilename_parsings, "w", encoding = 'utf-8')
-	outfile_corpus = codecs.open(outfile_corpus_name, "w", encoding = 'utf-8')
-	outfile_lexicon = codecs.open(outfile_lexicon_name, "w",encoding = 'utf-8')
-	outfile_simple_lexicon = open (outfile_simple_lexicon_name, "w", encoding = 'utf-8')
-	outfile_RecallPrecision = codecs.open(outfile_RecallPrecision_name, "w", encoding = 'utf-8')
-	outfile_glossary 	= codecs.open(glossary_name, "w", encoding = 'utf-8')		
-else:
-	outfile = open(outfilename, "w")
-	outfile_processed_corpus = open(outfilename_processed_corpus, "w") 	
-	outfile_parsings = open(outfilename_iterated_parsings, "w")
-	outfile_corpus = open(outfile_corpus_name, "w")
-	outfile_lexicon = open(outfile_lexicon_name, "w")
-	outfile_simple_lexicon = open (outfile_simple_lexicon_name, "w")
-	outfile_RecallPrecision = open(outfile_RecallPrecision_name, "w")
-	outfile_glossary 	= codecs.open(glossary_name, "w")
-	# Note that "outfile_processed_corpus" is the new output, July 29 2023, to output the entire best parse for each iteration.
-
-print  ("#" + str(corpusfile), file = outfile)
-print  ("#" + str(numberofcycles) + " cycles.", file = outfile)
-print  ("#" + str(numberoflines) + " lines in the original corpus.", file = outfile)
-print  ("#" + str(howmanycandidatesperiteration) + " candidates on each cycle.", file = outfile)
-
-current_iteration = 0	
-this_lexicon = Lexicon()
-this_lexicon.ReadBrokenCorpus (corpusfilename, numberoflines)
-print ( "#" + str(len(this_lexicon.m_TrueDictionary)) + " distinct words in the original corpus.", file=outfile)
-this_lexicon.PrintBrokenCorpus(outfile_processed_corpus, outfile_glossary)
-print ("finished printing broken corpus",outfilename_processed_corpus)
-
-if not os.path.isfile(outfilename_processed_corpus):
-			print ("Warning: ", outfilename_processed_corpus, " does not exist.")
-if g_encoding == "utf8":
-			infile = codecs.open(outfilename_processed_corpus, encoding = 'utf-8')
-else:
-			infile = open(outfilename_processed_corpus) 	 
-infile_processed_corpus = open(outfilename_processed_corpus)
-# do something with it
-
-filename_parsings			= outdirectory + shortoutname + "_iterated_parsings.txt"
-if not os.path.isfile(filename_parsings):
-			print ("Warning: ",  filename_parsings, " does not exist.")
-if g_encoding == "utf8":
-			infile = codecs.open(filename_parsings, encoding = 'utf-8')
-else:
-			infile = open(filename_parsings) 	 
-infile_parsings = open(filename_parsings)
-
-
-
-
-if (True):
-		#if g_encoding == "utf8":
-		#	outfile_2 = codecs.open(outfilename_processed_iterated_parsings, "a", encoding = 'utf-8')
-		#else:
-		#	outfile_2 = open(outfilename_iterated_parsings, "a") 	
-
-		this_lexicon.ParseCorpus (outfile, outfile_parsings,  current_iteration)
-		for current_iteration in range(1, numberofcycles):
-			print ("\n Iteration number", current_iteration, "out of ", numberofcycles)
-			print ("\n Iteration number", current_iteration, "out of ", numberofcycles, file = outfile)
-			this_lexicon.GenerateCandidates(howmanycandidatesperiteration, outfile)
-			this_lexicon.ParseCorpus (outfile, outfile_parsings, current_iteration)	 
-			this_lexicon.RecallPrecision(current_iteration, outfile,total_word_count_in_parse)
+	outfile_corpus_name		    = outdirectory + shortoutname + "_final_broken_corpus.txt"
+	outfile_lexicon_name	    = outdirectory + shortoutname + "_lexicon.txt"
+	outfile_simple_lexicon_name	= outdirectory + shortoutname + "_simple_lexicon.txt"
+	lexicon_file_name			= outdirectory + shortoutname + "_lexicon.bin"
+	outfile_RecallPrecision_name= outdirectory + shortoutname + "_RecallPrecision.tsv"
+	outfile_metrics_name		= outdirectory + shortoutname + "_metrics.jsonl"
+	glossary_name				= outdirectory + shortoutname + "_glossary.txt";
+	checkpoint_name				= outdirectory + shortoutname + "_checkpoint.json"
+
+	# On resuming, the outputs that are written a bit on each iteration go back to where they were at
+	# the checkpoint, and we carry on writing them from there.
+	checkpoint = None
+	outfile_mode = "w"
+	if arguments.resume:
+		checkpoint = read_checkpoint(checkpoint_name)
+		print ("Resuming after iteration", checkpoint["iteration"])
+		truncate_file(outfilename, checkpoint["outfile_size"])
+		outfile_mode = "a"
+		if arguments.parsings_format == "text":
+			truncate_file(outfilename_parsings, checkpoint["parsings"]["size"])
+
+	if g_encoding == "utf8":
+		outfile = codecs.open(outfilename, outfile_mode, encoding = 'utf-8')
+		outfile_processed_corpus = codecs.open(outfilename_processed_corpus, "w", encoding = 'utf-8')
+		outfile_corpus = codecs.open(outfile_corpus_name, "w", encoding = 'utf-8')
+		outfile_lexicon = codecs.open(outfile_lexicon_name, "w",encoding = 'utf-8')
+		outfile_simple_lexicon = open (outfile_simple_lexicon_name, "w", encoding = 'utf-8')
+		outfile_RecallPrecision = codecs.open(outfile_RecallPrecision_name, "w", encoding = 'utf-8')
+		outfile_glossary 	= codecs.open(glossary_name, "w", encoding = 'utf-8')		
+	else:
+		outfile = open(outfilename, outfile_mode)
+		outfile_processed_corpus = open(outfilename_processed_corpus, "w") 	
+		outfile_corpus = open(outfile_corpus_name, "w")
+		outfile_lexicon = open(outfile_lexicon_name, "w")
+		outfile_simple_lexicon = open (outfile_simple_lexicon_name, "w")
+		outfile_RecallPrecision = open(outfile_RecallPrecision_name, "w")
+		outfile_glossary 	= codecs.open(glossary_name, "w")
+		# Note that "outfile_processed_corpus" is the new output, July 29 2023, to output the entire best parse for each iteration.
+	if arguments.parsings_format == "binary":
+		outfile_parsings = BinaryParsingsWriter(outfilename_parsings, arguments.snapshot_interval, checkpoint and checkpoint["parsings"])
+	elif g_encoding == "utf8":
+		outfile_parsings = TextParsingsWriter(codecs.open(outfilename_parsings, outfile_mode, encoding = 'utf-8'))
+	else:
+		outfile_parsings = TextParsingsWriter(open(outfilename_parsings, outfile_mode))
+
+	if checkpoint is None:
+		print  ("#" + str(corpusfile), file = outfile)
+		print  ("#" + str(numberofcycles) + " cycles.", file = outfile)
+		print  ("#" + str(numberoflines) + " lines in the original corpus.", file = outfile)
+		print  ("#" + str(howmanycandidatesperiteration) + " candidates on each cycle.", file = outfile)
+
+	current_iteration = 0	
+	this_lexicon = Lexicon()
+	this_lexicon.m_NumberOfWorkers = numberofworkers
+	this_lexicon.m_IncrementalParsing = arguments.incremental
+	this_lexicon.m_ResyncInterval = arguments.resync
+	this_lexicon.m_TrainingMode = arguments.training
+	this_lexicon.m_CandidateScoring = arguments.scoring
+	this_lexicon.m_CompactCorpus = arguments.compact
+	this_lexicon.m_CheckWordMetrics = arguments.check_metrics
+	this_lexicon.m_ParseCacheSize = arguments.parse_cache_size
+	if arguments.metrics:
+		# a checkpoint from a run without --metrics has nothing of this file to keep
+		metrics_mode = "w"
+		if checkpoint is not None and "metrics_size" in checkpoint:
+			truncate_file(outfile_metrics_name, checkpoint["metrics_size"])
+			metrics_mode = "a"
+		outfile_metrics = open(outfile_metrics_name, metrics_mode, encoding = 'utf-8')
+		this_lexicon.m_Metrics = StageMetrics(outfile_metrics, arguments.metrics_memory)
+	this_lexicon.ReadBrokenCorpus (corpusfilename, numberoflines, outfile_processed_corpus)
+	if checkpoint is None:
+		print ( "#" + str(len(this_lexicon.m_TrueDictionary)) + " distinct words in the original corpus.", file=outfile)
+	this_lexicon.PrintBrokenCorpus(None, outfile_glossary)
+	print ("finished printing broken corpus",outfilename_processed_corpus)
+
+	if not os.path.isfile(outfilename_processed_corpus):
+				print ("Warning: ", outfilename_processed_corpus, " does not exist.")
+	if g_encoding == "utf8":
+				infile = codecs.open(outfilename_processed_corpus, encoding = 'utf-8')
+	else:
+				infile = open(outfilename_processed_corpus) 	 
+	infile_processed_corpus = open(outfilename_processed_corpus)
+	# do something with it
+
+	filename_parsings			= outfilename_parsings
+	if not os.path.isfile(filename_parsings):
+				print ("Warning: ",  filename_parsings, " does not exist.")
+	if g_encoding == "utf8":
+				infile = codecs.open(filename_parsings, encoding = 'utf-8')
+	else:
+				infile = open(filename_parsings) 	 
+	infile_parsings = open(filename_parsings)
+
+
+
+
+	if (True):
+			#if g_encoding == "utf8":
+			#	outfile_2 = codecs.open(outfilename_processed_iterated_parsings, "a", encoding = 'utf-8')
+			#else:
+			#	outfile_2 = open(outfilename_iterated_parsings, "a") 	
+
+			if checkpoint is None:
+				this_lexicon.ParseCorpus (outfile, outfile_parsings,  current_iteration)
+				this_lexicon.EndIterationMetrics(current_iteration)
+				first_iteration = 1
+			else:
+				this_lexicon.Resume(checkpoint)
+				first_iteration = checkpoint["iteration"] + 1
+			for current_iteration in range(first_iteration, numberofcycles):
+				print ("\n Iteration number", current_iteration, "out of ", numberofcycles)
+				print ("\n Iteration number", current_iteration, "out of ", numberofcycles, file = outfile)
+				this_lexicon.GenerateCandidates(howmanycandidatesperiteration, outfile)
+				this_lexicon.ParseCorpus (outfile, outfile_parsings, current_iteration)	 
+				this_lexicon.RecallPrecision(current_iteration, outfile,total_word_count_in_parse)
+				this_lexicon.EndIterationMetrics(current_iteration)
+				# the last iteration is always saved, so that the finished lexicon can be loaded by segmenter.py
+				if arguments.checkpoint_interval > 0 and (current_iteration % arguments.checkpoint_interval == 0 or current_iteration == numberofcycles - 1):
+					this_checkpoint = this_lexicon.Checkpoint(current_iteration)
+					outfile.flush()
+					this_checkpoint["outfile_size"] = os.path.getsize(outfilename)
+					this_checkpoint["parsings"] = outfile_parsings.Checkpoint()
+					if arguments.metrics:
+						outfile_metrics.flush()
+						this_checkpoint["metrics_size"] = os.path.getsize(outfile_metrics_name)
+					write_checkpoint(checkpoint_name, this_checkpoint)
 				
-		this_lexicon.PrintParsedCorpus(outfile_corpus)
-		this_lexicon.PrintLexicon(outfile_lexicon)
-		this_lexicon.PrintSimpleLexicon(outfile_simple_lexicon)
-		this_lexicon.PrintRecallPrecision(outfile_RecallPrecision) 	 
-		outfile.close()
-		outfile_processed_corpus.close()
-		outfile_corpus.close()
-		outfile_lexicon.close()
-		outfile_simple_lexicon.close()
-		outfile_RecallPrecision.close()
-		outfile_glossary.close()
-
-
- 
-
+			candidates_added = sum(added for iteration, added, deleted, others in this_lexicon.m_CandidateHistory)
+			candidates_deleted = sum(deleted for iteration, added, deleted, others in this_lexicon.m_CandidateHistory)
+			print ("Candidates added: ", "{:,}".format(candidates_added), " deleted in the iteration they were added: ", "{:,}".format(candidates_deleted))
+			this_lexicon.PrintParsedCorpus(outfile_corpus)
+			this_lexicon.PrintLexicon(outfile_lexicon)
+			this_lexicon.PrintSimpleLexicon(outfile_simple_lexicon)
+			# the finished lexicon, for segmenter.py
+			write_lexicon_file(lexicon_file_name, this_lexicon.m_EntryPlog)
+			this_lexicon.PrintRecallPrecision(outfile_RecallPrecision) 	 
+			outfile.close()
+			outfile_processed_corpus.close()
+			outfile_corpus.close()
+			outfile_lexicon.close()
+			outfile_simple_lexicon.close()
+			outfile_RecallPrecision.close()
+			outfile_glossary.close()
+			outfile_parsings.close()
+
+
+if __name__ == "__main__":
+	main()